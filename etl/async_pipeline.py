@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime
+from typing import Optional
+
+from config import (
+    ES_BULK_CONCURRENCY,
+    ES_MAX_BULK_REQUESTS,
+    ETL_QUEUE_SIZE,
+    PG_FETCH_SIZE,
+    PG_MAX_CONNECTIONS,
+    dsl,
+    es_conf,
+)
+from elasticsearch_loader import AsyncElasticSearchLoader
+from hash_store import DocumentHashStore
+from metrics import metrics
+from postgres_loader import PostgresLoader
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+from state import State, make_storage
+from transform import ColumnMapper
+
+from services import async_backoff
+
+logger = logging.getLogger("AsyncPipeline")
+
+
+class StageStats:
+    """
+    Счётчики этапа конвейера: сколько документов прошло через этап
+    и сколько времени он был занят работой, а не ожиданием очередей.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.docs: int = 0
+        self.busy: float = 0.0
+
+    def report(self, index_name: str, wall: float) -> None:
+        rate = self.docs / wall if wall else 0.0
+        logger.info(
+            f"{datetime.now()}\n\n{index_name}/{self.name}: {self.docs} документов, "
+            f"занят {self.busy:.2f} с из {wall:.2f} с, {rate:.0f} док/с"
+        )
+
+
+class AsyncPipeline:
+    """
+    Конвейер extract -> transform -> load для одного индекса.
+    Этапы связаны ограниченными очередями: медленный этап притормаживает
+    предыдущий, а не копит пачки в памяти.
+    """
+
+    def __init__(
+        self,
+        columns: list[str],
+        state_file: str,
+        query: str,
+        index_name: str,
+        index_schema: dict,
+        batch: int = PG_FETCH_SIZE,
+        concurrency: int = ES_BULK_CONCURRENCY,
+        queue_size: int = ETL_QUEUE_SIZE,
+        state_key: str = "key",
+        pg_semaphore: Optional[asyncio.Semaphore] = None,
+        es_semaphore: Optional[asyncio.Semaphore] = None,
+        hash_store: Optional[DocumentHashStore] = None,
+    ):
+        self.columns = columns
+        self.query = query
+        self.index_name = index_name
+        self.index_schema = index_schema
+        self.batch = batch
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.state_key = state_key
+        # Общие для всех конвейеров ограничения соединений с PostgreSQL
+        # и bulk-запросов в Elasticsearch
+        self.pg_semaphore = pg_semaphore
+        self.es_semaphore = es_semaphore
+        self.state = State(make_storage(state_file))
+        self.es_loader = AsyncElasticSearchLoader(
+            host=es_conf,
+            index_name=index_name,
+            state_key=state_key,
+            hash_store=hash_store,
+        )
+        # psycopg 3 отдаёт строки словарями, поэтому поля берутся по имени
+        self.to_docs = ColumnMapper(columns, by_name=True)
+        self.acked: dict[int, dict] = {}
+        self.next_seq: int = 0
+        self.stats: dict[str, StageStats] = {
+            name: StageStats(name) for name in ("extract", "transform", "load")
+        }
+
+    @async_backoff()
+    async def connect_postgres(self) -> AsyncConnection:
+        return await AsyncConnection.connect(**dsl, row_factory=dict_row)
+
+    async def extract(self) -> None:
+        """
+        Читаем главный запрос именованным курсором и кладём пачки в очередь.
+        """
+        stats = self.stats["extract"]
+        watermark = PostgresLoader.make_watermark(self.state.get_state(self.state_key))
+        async with AsyncExitStack() as stack:
+            if self.pg_semaphore:
+                await stack.enter_async_context(self.pg_semaphore)
+            pg_conn = await self.connect_postgres()
+            stack.push_async_callback(pg_conn.close)
+            async with pg_conn.cursor(name=f"{self.index_name}_cursor") as cursor:
+                cursor.itersize = self.batch
+                await cursor.execute(self.query, watermark)
+                seq: int = 0
+                while True:
+                    started = time.monotonic()
+                    records = await cursor.fetchmany(self.batch)
+                    stats.busy += time.monotonic() - started
+                    metrics.observe_stage(
+                        self.index_name, "extract", time.monotonic() - started
+                    )
+                    if not records:
+                        break
+                    stats.docs += len(records)
+                    await self.rows_queue.put((seq, records))
+                    seq += 1
+        await self.rows_queue.put(None)
+
+    async def transform(self) -> None:
+        """
+        Превращаем строки в документы и сразу собираем из них тела bulk-запросов.
+        """
+        stats = self.stats["transform"]
+        while (item := await self.rows_queue.get()) is not None:
+            seq, records = item
+            started = time.monotonic()
+            actions = self.to_docs(records)
+            actions, hashes = self.es_loader.select_changed(actions)
+            bodies = list(self.es_loader.iter_bulk_bodies(actions))
+            checkpoint = PostgresLoader.batch_checkpoint(records)
+            stats.busy += time.monotonic() - started
+            stats.docs += len(records)
+            metrics.observe_stage(
+                self.index_name, "transform", time.monotonic() - started
+            )
+            await self.bodies_queue.put(
+                (seq, bodies, len(actions), hashes, checkpoint)
+            )
+        for _ in range(self.concurrency):
+            await self.bodies_queue.put(None)
+
+    async def load(self) -> None:
+        """
+        Один из concurrency загрузчиков: одновременно в полёте не больше
+        concurrency bulk-запросов.
+        """
+        stats = self.stats["load"]
+        while (item := await self.bodies_queue.get()) is not None:
+            seq, bodies, count, hashes, checkpoint = item
+            started = time.monotonic()
+            failed: set[str] = set()
+            for body in bodies:
+                failed |= await self.bulk(body=body)
+            self.es_loader.remember(sent=count, hashes=hashes, failed=failed)
+            stats.busy += time.monotonic() - started
+            stats.docs += count
+            self.acknowledge(seq=seq, checkpoint=checkpoint)
+
+    async def bulk(self, body: bytes) -> set[str]:
+        """
+        Отправка с повтором элементов, отклонённых из-за перегрузки. Место
+        в общем семафоре держится и на время паузы, чтобы не усиливать нагрузку.
+        """
+        if not self.es_semaphore:
+            return await self.es_loader.send_bulk(body=body)
+        async with self.es_semaphore:
+            return await self.es_loader.send_bulk(body=body)
+
+    def acknowledge(self, seq: int, checkpoint: dict) -> None:
+        """
+        bulk-запросы завершаются в произвольном порядке, поэтому отметку
+        сохраняем только когда подтверждены все предыдущие пачки.
+        """
+        self.acked[seq] = checkpoint
+        last = None
+        while self.next_seq in self.acked:
+            last = self.acked.pop(self.next_seq)
+            self.next_seq += 1
+        if last:
+            watch = metrics.stopwatch(self.index_name)
+            self.state.set_state(key=self.state_key, value=last)
+            watch.lap("checkpoint")
+            metrics.observe_checkpoint(self.index_name, last)
+            self.es_loader.bump_generation()
+
+    async def run(self) -> None:
+        logger.info(
+            f"{datetime.now()}\n\nзапуск асинхронного конвейера индекса {self.index_name}"
+        )
+        self.rows_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.bodies_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        started = time.monotonic()
+        await self.es_loader.create_index(index_schema=self.index_schema)
+        tasks = [
+            asyncio.create_task(self.extract()),
+            asyncio.create_task(self.transform()),
+            *(asyncio.create_task(self.load()) for _ in range(self.concurrency)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+            await self.es_loader.refresh_index()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.es_loader.close()
+        wall = time.monotonic() - started
+        for stats in self.stats.values():
+            stats.report(index_name=self.index_name, wall=wall)
+        self.es_loader.report_counts()
+
+
+async def run_pipelines(
+    pipelines: list[dict],
+    max_connections: int = PG_MAX_CONNECTIONS,
+    max_bulk_requests: int = ES_MAX_BULK_REQUESTS,
+) -> None:
+    """
+    Запускаем конвейеры всех индексов одновременно: небольшие genre и person
+    не ждут окончания загрузки movies. Семафоры ограничивают общее число
+    соединений с PostgreSQL и bulk-запросов в полёте.
+    """
+    pg_semaphore = asyncio.Semaphore(max_connections)
+    es_semaphore = asyncio.Semaphore(max_bulk_requests)
+    hash_store = DocumentHashStore()
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(
+            AsyncPipeline(
+                **pipeline,
+                pg_semaphore=pg_semaphore,
+                es_semaphore=es_semaphore,
+                hash_store=hash_store,
+            ).run()
+            for pipeline in pipelines
+        ),
+        return_exceptions=True,
+    )
+    logger.info(
+        f"{datetime.now()}\n\nвсе конвейеры завершены за {time.monotonic() - started:.2f} с"
+    )
+    for pipeline, result in zip(pipelines, results):
+        if isinstance(result, Exception):
+            logger.error(
+                f"{datetime.now()}\n\nконвейер {pipeline['index_name']} упал: {result!r}"
+            )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
@@ -0,0 +1,183 @@
+"""
+Синтетический каталог в схеме content для замеров ETL.
+Схема пересоздаётся целиком, поэтому генератор работает только
+с отдельной базой BENCH_DB_NAME и отказывается трогать рабочую.
+
+Каталог можно создать отдельно:
+
+    BENCH_DB_NAME=movies_bench python -m benchmarks.catalog --films 100000
+"""
+import argparse
+import logging
+import os
+from contextlib import closing
+
+import psycopg2
+from config import dsl
+from query import bootstrap_indexes_queries
+
+logger = logging.getLogger("BenchCatalog")
+
+bench_dsl: dict = {**dsl, "dbname": os.getenv("BENCH_DB_NAME", "movies_bench")}
+
+schema_queries: list[str] = [
+    "DROP SCHEMA IF EXISTS content CASCADE;",
+    "CREATE SCHEMA content;",
+    """
+    CREATE TABLE content.film_work (
+        id uuid PRIMARY KEY,
+        title text NOT NULL,
+        description text,
+        rating float,
+        roles text,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE content.person (
+        id uuid PRIMARY KEY,
+        full_name text NOT NULL,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE content.genre (
+        id uuid PRIMARY KEY,
+        name text NOT NULL,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE content.person_film_work (
+        id uuid PRIMARY KEY,
+        film_work_id uuid NOT NULL REFERENCES content.film_work ON DELETE CASCADE,
+        person_id uuid NOT NULL REFERENCES content.person ON DELETE CASCADE,
+        role text NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE content.genre_film_work (
+        id uuid PRIMARY KEY,
+        film_work_id uuid NOT NULL REFERENCES content.film_work ON DELETE CASCADE,
+        genre_id uuid NOT NULL REFERENCES content.genre ON DELETE CASCADE
+    );
+    """,
+]
+
+# Связи раскладываются детерминированно по номеру строки, чтобы каталог
+# одного размера давал сопоставимые замеры между запусками.
+fill_queries: list[str] = [
+    """
+    INSERT INTO content.genre (id, name, updated_at)
+    SELECT gen_random_uuid(), 'genre ' || i, now() - random() * interval '365 days'
+    FROM generate_series(1, %(genres)s) AS i;
+    """,
+    """
+    INSERT INTO content.person (id, full_name, updated_at)
+    SELECT gen_random_uuid(), 'person ' || i, now() - random() * interval '365 days'
+    FROM generate_series(1, %(persons)s) AS i;
+    """,
+    """
+    INSERT INTO content.film_work (id, title, description, rating, roles, updated_at)
+    SELECT
+        gen_random_uuid(),
+        'film ' || i,
+        repeat('description of film ' || i || ' ', 10),
+        round((random() * 10)::numeric, 1),
+        'anonymous,subscriber',
+        now() - random() * interval '365 days'
+    FROM generate_series(1, %(films)s) AS i;
+    """,
+    """
+    INSERT INTO content.person_film_work (id, film_work_id, person_id, role)
+    SELECT
+        gen_random_uuid(),
+        fw.id,
+        p.id,
+        CASE WHEN n %% 10 = 0 THEN 'director' WHEN n %% 5 = 0 THEN 'writer' ELSE 'actor' END
+    FROM (SELECT id, row_number() OVER (ORDER BY id) AS rn FROM content.film_work) AS fw
+    CROSS JOIN generate_series(1, %(persons_per_film)s) AS n
+    JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS rn FROM content.person) AS p
+        ON p.rn = (fw.rn * 7919 + n * 104729) %% %(persons)s;
+    """,
+    """
+    INSERT INTO content.genre_film_work (id, film_work_id, genre_id)
+    SELECT gen_random_uuid(), fw.id, g.id
+    FROM (SELECT id, row_number() OVER (ORDER BY id) AS rn FROM content.film_work) AS fw
+    CROSS JOIN generate_series(1, %(genres_per_film)s) AS n
+    JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS rn FROM content.genre) AS g
+        ON g.rn = (fw.rn + n) %% %(genres)s;
+    """,
+]
+
+
+def generate_catalog(
+    films: int,
+    persons: int,
+    genres: int,
+    persons_per_film: int,
+    genres_per_film: int,
+    with_indexes: bool = True,
+) -> None:
+    """
+    Пересоздаём схему content в базе для замеров и заполняем её
+    средствами самого PostgreSQL, без передачи строк через клиента.
+    """
+    if bench_dsl["dbname"] == dsl["dbname"]:
+        raise ValueError("BENCH_DB_NAME совпадает с рабочей базой DB_NAME")
+    params: dict = {
+        "films": films,
+        "persons": persons,
+        "genres": genres,
+        "persons_per_film": persons_per_film,
+        "genres_per_film": genres_per_film,
+    }
+    with closing(psycopg2.connect(**bench_dsl)) as pg_conn:
+        with pg_conn.cursor() as cursor:
+            for query in schema_queries:
+                cursor.execute(query)
+            for query in fill_queries:
+                cursor.execute(query, params)
+        pg_conn.commit()
+        # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+        pg_conn.autocommit = True
+        with pg_conn.cursor() as cursor:
+            if with_indexes:
+                for query in bootstrap_indexes_queries:
+                    cursor.execute(query)
+            cursor.execute("ANALYZE;")
+    logger.info(f"синтетический каталог создан: {params}")
+
+
+def add_catalog_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Общие для всех замеров параметры размера каталога.
+    """
+    parser.add_argument("--films", type=int, default=20000)
+    parser.add_argument("--persons", type=int, default=50000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--persons-per-film", type=int, default=40)
+    parser.add_argument("--genres-per-film", type=int, default=5)
+    parser.add_argument(
+        "--skip-generate", action="store_true", help="использовать готовый каталог"
+    )
+
+
+def catalog_params(args: argparse.Namespace) -> dict:
+    return {
+        "films": args.films,
+        "persons": args.persons,
+        "genres": args.genres,
+        "persons_per_film": args.persons_per_film,
+        "genres_per_film": args.genres_per_film,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетический каталог для замеров")
+    add_catalog_arguments(parser)
+    parser.add_argument(
+        "--no-indexes", action="store_true", help="не создавать индексы источника"
+    )
+    args = parser.parse_args()
+    generate_catalog(**catalog_params(args), with_indexes=not args.no_indexes)
@@ -0,0 +1,215 @@
+"""
+Замер пропускной способности ETL на синтетическом каталоге: извлечение,
+сборка документов, bulk-загрузка и сохранение отметок по каждому индексу.
+Загрузка идёт в локальный Elasticsearch или во встроенную заглушку bulk,
+которая только считает байты, чтобы мерить сам ETL без кластера.
+Результаты дописываются строкой JSON в файл, чтобы сравнивать коммиты.
+Запуск из каталога etl:
+
+    BENCH_DB_NAME=movies_bench python -m benchmarks.etl_throughput --films 20000
+    python -m benchmarks.etl_throughput --skip-generate --target es --path copy
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Optional
+
+import psycopg2
+from config import PG_FETCH_SIZE, es_conf
+from copy_extractor import CopyExtractor
+from elasticsearch_loader import ElasticSearchLoader
+from pipelines import PIPELINES
+from postgres_loader import PostgresLoader
+from psycopg2.extras import DictCursor
+from state import SQLiteStorage, State
+from transform import ColumnMapper
+
+from benchmarks.catalog import (
+    add_catalog_arguments,
+    bench_dsl,
+    catalog_params,
+    generate_catalog,
+)
+
+STAGES: tuple[str, ...] = ("extract", "transform", "bulk", "checkpoint")
+
+
+class FakeTransport:
+    """
+    Заглушка транспорта Elasticsearch: принимает тело bulk-запроса,
+    считает элементы и отвечает как кластер без ошибок.
+    """
+
+    def perform_request(self, method: str, url: str, headers=None, body=None) -> dict:
+        items = body.count(b"\n") // 2
+        return {"errors": False, "items": [{"index": {"status": 201}}] * items}
+
+
+class FakeClient:
+    def __init__(self):
+        self.transport = FakeTransport()
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds: dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.started: float = 0.0
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+
+    def stop(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.seconds[stage] += now - self.started
+        self.started = now
+
+
+def bench_index(
+    pg_conn,
+    pipeline: dict,
+    target: str,
+    path: str,
+    batch: int,
+    state: State,
+) -> dict:
+    """
+    Полная загрузка одного индекса. Время этапов считается отдельно,
+    поэтому bulk_actions не используется: сборка тел и отправка разделены.
+    """
+    index_name = f"bench_{pipeline['index_name']}"
+    if target == "es":
+        es_loader = ElasticSearchLoader(host=es_conf, index_name=index_name)
+        es_loader.client.indices.delete(index=index_name, ignore=404)
+        es_loader.create_index(index_schema=pipeline["index_schema"])
+    else:
+        es_loader = ElasticSearchLoader(
+            host=es_conf, index_name=index_name, client=FakeClient()
+        )
+    timer = StageTimer()
+    counts: dict = {"rows": 0, "bytes": 0, "rejected": 0}
+
+    def load(docs: list[dict], checkpoint: dict) -> None:
+        for body in es_loader.iter_bulk_bodies(docs, reuse=True):
+            size = len(body)
+            timer.stop("transform")
+            counts["rejected"] += len(es_loader.send_bulk(body))
+            counts["bytes"] += size
+            timer.stop("bulk")
+        state.set_state(key=index_name, value=checkpoint)
+        counts["rows"] += len(docs)
+        timer.stop("checkpoint")
+
+    watermark = PostgresLoader.make_watermark(datetime.min)
+    started = time.perf_counter()
+    timer.start()
+    if path == "copy":
+        # COPY отдаёт уже разобранные документы: извлечение и разбор неразделимы
+        def on_batch(docs: list[dict], checkpoint: dict) -> None:
+            timer.stop("extract")
+            load(docs, checkpoint)
+
+        CopyExtractor(pg_conn, columns=pipeline["columns"], batch=batch).extract(
+            query=pipeline["query"], watermark=watermark, on_batch=on_batch
+        )
+    else:
+        to_docs = ColumnMapper(pipeline["columns"])
+        with pg_conn.cursor(name=f"{index_name}_cursor") as cursor:
+            cursor.itersize = batch
+            cursor.execute(pipeline["query"], watermark)
+            while rows := cursor.fetchmany(batch):
+                timer.stop("extract")
+                docs = to_docs(rows)
+                load(docs, PostgresLoader.batch_checkpoint(rows))
+        pg_conn.rollback()
+    wall = time.perf_counter() - started
+    if target == "es":
+        es_loader.refresh_index()
+        es_loader.client.indices.delete(index=index_name, ignore=404)
+    return {
+        "index": pipeline["index_name"],
+        "rows": counts["rows"],
+        "bulk_bytes": counts["bytes"],
+        "rejected": counts["rejected"],
+        "seconds": round(wall, 4),
+        "rows_per_second": round(counts["rows"] / wall, 1) if wall else 0.0,
+        "bulk_bytes_per_second": round(counts["bytes"] / wall, 1) if wall else 0.0,
+        "stages": {stage: round(value, 4) for stage, value in timer.seconds.items()},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux — килобайты
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер пропускной способности ETL")
+    add_catalog_arguments(parser)
+    parser.add_argument(
+        "--target",
+        choices=("fake", "es"),
+        default="fake",
+        help="fake — встроенная заглушка bulk, es — локальный Elasticsearch",
+    )
+    parser.add_argument("--path", choices=("cursor", "copy"), default="cursor")
+    parser.add_argument("--batch", type=int, default=PG_FETCH_SIZE)
+    parser.add_argument(
+        "--output",
+        default="benchmarks/results.jsonl",
+        help="файл результатов, по строке JSON на запуск",
+    )
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        generate_catalog(**catalog_params(args))
+    with tempfile.TemporaryDirectory() as state_dir:
+        state = State(SQLiteStorage("bench", path=os.path.join(state_dir, "state.db")))
+        with closing(psycopg2.connect(**bench_dsl, cursor_factory=DictCursor)) as pg_conn:
+            indexes = [
+                bench_index(
+                    pg_conn=pg_conn,
+                    pipeline=pipeline,
+                    target=args.target,
+                    path=args.path,
+                    batch=args.batch,
+                    state=state,
+                )
+                for pipeline in PIPELINES
+            ]
+    result: dict = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "target": args.target,
+        "path": args.path,
+        "batch": args.batch,
+        "catalog": catalog_params(args),
+        "indexes": indexes,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    with open(args.output, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    for index in indexes:
+        stages = ", ".join(f"{name} {value:.2f} с" for name, value in index["stages"].items())
+        print(
+            f"{index['index']:>8}: {index['rows']} записей, {index['rows_per_second']:.0f}"
+            f" записей/с, {index['bulk_bytes_per_second'] / 2**20:.1f} МиБ/с bulk ({stages})"
+        )
+    print(f"пиковый RSS: {result['peak_rss_mb']} МиБ, результаты в {args.output}")
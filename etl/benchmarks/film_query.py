@@ -0,0 +1,92 @@
+"""
+Сравнение выборки фильмов на синтетическом каталоге: прежний запрос с общим
+GROUP BY по join персон и жанров против LATERAL-подзапросов из query.py.
+Запуск из каталога etl:
+
+    BENCH_DB_NAME=movies_bench python -m benchmarks.film_query --films 20000
+"""
+import argparse
+import math
+import time
+from contextlib import closing
+from datetime import datetime
+
+import psycopg2
+from postgres_loader import MIN_ID
+from query import film_work_query
+
+from benchmarks.catalog import (
+    add_catalog_arguments,
+    bench_dsl,
+    catalog_params,
+    generate_catalog,
+)
+
+# Запрос до перехода на LATERAL: каждая персона фильма умножается на каждый жанр
+legacy_film_work_query: str = """
+    select
+    fw.id,
+    fw.title,
+    fw.description,
+    fw.rating as imdb_rating,
+    fw.roles as permissions,
+    array_agg(distinct g.name) as genre,
+    array_agg(distinct p.full_name) filter (WHERE pfw.role = 'director') as director,
+    array_agg(distinct p.full_name) filter (where pfw.role = 'actor') as actors_names,
+    array_agg(distinct p.full_name) filter (where pfw.role = 'writer') as writers_names,
+    array_agg(distinct jsonb_build_object('id', p.id, 'full_name', p.full_name)) filter (where pfw.role = 'actor') as actors,
+    array_agg(distinct jsonb_build_object('id', p.id, 'full_name', p.full_name)) filter (where pfw.role = 'writer') as writers,
+    array_agg(distinct jsonb_build_object('id', p.id, 'full_name', p.full_name)) filter (where pfw.role = 'director') as directors,
+    greatest(fw.updated_at, max(p.updated_at), max(g.updated_at)) as updated_at
+    from content.film_work fw
+    left join content.person_film_work as pfw on pfw.film_work_id = fw.id
+    left join content.person as p on p.id = pfw.person_id
+    left join content.genre_film_work gfw on gfw.film_work_id = fw.id
+    left join content.genre g on g.id = gfw.genre_id
+    where greatest(fw.updated_at, p.updated_at, g.updated_at) >= %(updated_at)s
+    group by fw.id
+    having (greatest(fw.updated_at, max(p.updated_at), max(g.updated_at)), fw.id)
+        > (%(updated_at)s, %(last_id)s)
+    order by updated_at, fw.id;
+"""
+
+
+def time_query(pg_conn, query: str, params: dict, repeat: int) -> tuple[float, int]:
+    """
+    Лучшее время полного чтения результата именованным курсором и число строк.
+    """
+    best: float = math.inf
+    rows: int = 0
+    for _ in range(repeat):
+        with pg_conn.cursor(name="bench_cursor") as cursor:
+            cursor.itersize = 1000
+            started = time.perf_counter()
+            cursor.execute(query, params)
+            rows = sum(1 for _ in cursor)
+            best = min(best, time.perf_counter() - started)
+        pg_conn.rollback()
+    return best, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер запросов выборки фильмов")
+    add_catalog_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        generate_catalog(**catalog_params(args))
+    # Полная загрузка: отметка с самого начала
+    params: dict = {"updated_at": f"{datetime.min}", "last_id": MIN_ID}
+    with closing(psycopg2.connect(**bench_dsl)) as pg_conn:
+        for name, query in (
+            ("join + group by", legacy_film_work_query),
+            ("lateral", film_work_query),
+        ):
+            seconds, rows = time_query(
+                pg_conn=pg_conn, query=query, params=params, repeat=args.repeat
+            )
+            print(
+                f"{name:>16}: {rows} фильмов за {seconds:.3f} с, "
+                f"{rows / seconds:.0f} строк/с"
+            )
@@ -0,0 +1,257 @@
+import logging
+import select
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Optional
+
+import psycopg2
+from config import (
+    CDC_BATCH_SIZE,
+    CDC_FLUSH_INTERVAL,
+    CDC_PUBLICATION,
+    CDC_SLOT_NAME,
+    dsl,
+    es_conf,
+)
+from elasticsearch_loader import ElasticSearchLoader
+from hash_store import DocumentHashStore
+from pipelines import PIPELINES, film_work_columns, genre_columns, person_columns
+from pgoutput import ChangeBatch, PgOutputDecoder
+from postgres_loader import PostgresLoader
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import DictCursor, LogicalReplicationConnection
+from query import (
+    film_work_by_ids_query,
+    genre_by_ids_query,
+    genre_film_ids_query,
+    person_by_ids_query,
+    person_film_ids_query,
+)
+from state import State, make_storage
+from transform import ColumnMapper
+
+from services import backoff
+
+logger = logging.getLogger("CDC")
+
+# Таблицы, изменения которых попадают в индексы
+cdc_tables: list[str] = [
+    "content.film_work",
+    "content.person",
+    "content.genre",
+    "content.person_film_work",
+    "content.genre_film_work",
+]
+
+# Без полной идентичности строки удаление связи приходит только с её id,
+# а нужен id фильма и персоны
+replica_identity_full_tables: list[str] = [
+    "content.person_film_work",
+    "content.genre_film_work",
+]
+
+
+class CdcExtractor:
+    """
+    Источник изменений из логического декодирования PostgreSQL вместо опроса
+    updated_at: видит удаления и не сканирует таблицы. Изменения копятся
+    по id документов и сбрасываются через обычный путь перечитывания
+    по id и bulk-загрузки. Отметкой служит LSN последнего загруженного коммита.
+    """
+
+    def __init__(
+        self,
+        state_file: str = "cdc_data.txt",
+        hash_store: Optional[DocumentHashStore] = None,
+        batch_size: int = CDC_BATCH_SIZE,
+        flush_interval: float = CDC_FLUSH_INTERVAL,
+        slot_name: str = CDC_SLOT_NAME,
+        publication: str = CDC_PUBLICATION,
+    ):
+        self.state_file = state_file
+        self.state = State(make_storage(state_file))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.slot_name = slot_name
+        self.publication = publication
+        self.decoder = PgOutputDecoder()
+        self.batch = ChangeBatch()
+        self.loaders: dict[str, ElasticSearchLoader] = {
+            pipeline["index_name"]: ElasticSearchLoader(
+                host=es_conf, index_name=pipeline["index_name"], hash_store=hash_store
+            )
+            for pipeline in PIPELINES
+        }
+
+    @backoff()
+    def connect_postgres(self) -> _connection:
+        return psycopg2.connect(**dsl, cursor_factory=DictCursor)
+
+    @backoff()
+    def connect_replication(self) -> _connection:
+        return psycopg2.connect(**dsl, connection_factory=LogicalReplicationConnection)
+
+    def setup(self) -> None:
+        """
+        Идемпотентно создаём публикацию и слот репликации.
+        Требуется wal_level=logical на сервере.
+        """
+        with closing(self.connect_postgres()) as pg_conn:
+            pg_conn.autocommit = True
+            with pg_conn.cursor() as cursor:
+                for table in replica_identity_full_tables:
+                    # ALTER TABLE берёт ACCESS EXCLUSIVE, поэтому только если нужно
+                    cursor.execute(
+                        "SELECT relreplident FROM pg_class WHERE oid = %s::regclass;",
+                        (table,),
+                    )
+                    if cursor.fetchone()[0] != "f":
+                        cursor.execute(f"ALTER TABLE {table} REPLICA IDENTITY FULL;")
+                cursor.execute(
+                    "SELECT 1 FROM pg_publication WHERE pubname = %s;",
+                    (self.publication,),
+                )
+                if not cursor.fetchone():
+                    cursor.execute(
+                        f"CREATE PUBLICATION {self.publication}"
+                        f" FOR TABLE {', '.join(cdc_tables)};"
+                    )
+                cursor.execute(
+                    "SELECT 1 FROM pg_replication_slots WHERE slot_name = %s;",
+                    (self.slot_name,),
+                )
+                if not cursor.fetchone():
+                    cursor.execute(
+                        "SELECT pg_create_logical_replication_slot(%s, 'pgoutput');",
+                        (self.slot_name,),
+                    )
+                    logger.info(
+                        f"{datetime.now()}\n\nсоздан слот репликации {self.slot_name}"
+                    )
+
+    def run(self) -> None:
+        self.setup()
+        for pipeline in PIPELINES:
+            self.loaders[pipeline["index_name"]].create_index(
+                index_schema=pipeline["index_schema"]
+            )
+        with closing(self.connect_postgres()) as pg_conn, closing(
+            self.connect_replication()
+        ) as repl_conn:
+            self.postgres_loader = PostgresLoader(pg_conn, state_file=self.state_file)
+            cursor = repl_conn.cursor()
+            cursor.start_replication(
+                slot_name=self.slot_name,
+                decode=False,
+                start_lsn=self.state.state.get("lsn", 0),
+                options={"proto_version": "1", "publication_names": self.publication},
+            )
+            logger.info(f"{datetime.now()}\n\nчтение изменений из слота {self.slot_name}")
+            commit_lsn: Optional[int] = None
+            flushed_at = time.monotonic()
+            while True:
+                message = cursor.read_message()
+                if message is None:
+                    idle = time.monotonic() - flushed_at
+                    if commit_lsn and idle >= self.flush_interval:
+                        self.flush(cursor=cursor, lsn=commit_lsn)
+                        commit_lsn, flushed_at = None, time.monotonic()
+                    select.select([cursor], [], [], self.flush_interval)
+                    continue
+                change = self.decoder.decode(message.payload)
+                if not change:
+                    continue
+                if change.kind != "commit":
+                    self.batch.add(change)
+                    continue
+                # Сбрасываем только на границе транзакции, чтобы LSN-отметка
+                # не разрезала транзакцию
+                commit_lsn = change.lsn
+                if (
+                    len(self.batch) >= self.batch_size
+                    or time.monotonic() - flushed_at >= self.flush_interval
+                ):
+                    self.flush(cursor=cursor, lsn=commit_lsn)
+                    commit_lsn, flushed_at = None, time.monotonic()
+
+    def flush(self, cursor, lsn: int) -> None:
+        """
+        Перечитываем затронутые документы, удаляем удалённые, делаем их
+        видимыми поиску, затем сохраняем LSN и подтверждаем его серверу,
+        чтобы тот мог освободить WAL.
+        """
+        batch, self.batch = self.batch, ChangeBatch()
+        if batch:
+            film_ids = batch.film_ids
+            for query, ids in (
+                (person_film_ids_query, batch.changed_person_ids),
+                (genre_film_ids_query, batch.changed_genre_ids),
+            ):
+                if ids:
+                    film_ids |= set(
+                        self.postgres_loader.get_related_ids(query=query, ids=list(ids))
+                    )
+            written: list[ElasticSearchLoader] = []
+            for index_name, columns, query, ids, deleted_ids in (
+                (
+                    "movies",
+                    film_work_columns,
+                    film_work_by_ids_query,
+                    film_ids,
+                    batch.deleted_film_ids,
+                ),
+                (
+                    "person",
+                    person_columns,
+                    person_by_ids_query,
+                    batch.person_ids,
+                    batch.deleted_person_ids,
+                ),
+                (
+                    "genre",
+                    genre_columns,
+                    genre_by_ids_query,
+                    batch.genre_ids,
+                    batch.deleted_genre_ids,
+                ),
+            ):
+                self.load(
+                    es_loader=self.loaders[index_name],
+                    columns=columns,
+                    query=query,
+                    ids=list(ids - deleted_ids),
+                    deleted_ids=list(deleted_ids),
+                )
+                if ids or deleted_ids:
+                    written.append(self.loaders[index_name])
+            # Как в демоне: refresh ещё раз увеличивает поколение кеша API,
+            # и ответ, закешированный до обновления индекса, не переживёт его
+            for es_loader in written:
+                es_loader.refresh_index()
+            # Чтение в обычном соединении не должно держать открытую транзакцию
+            self.postgres_loader.conn.rollback()
+            logger.info(
+                f"{datetime.now()}\n\nCDC: {len(batch)} изменений загружено до LSN {lsn}"
+            )
+        self.state.set_state(key="lsn", value=lsn)
+        cursor.send_feedback(flush_lsn=lsn)
+
+    def load(
+        self,
+        es_loader: ElasticSearchLoader,
+        columns: list[str],
+        query: str,
+        ids: list[str],
+        deleted_ids: list[str],
+    ) -> None:
+        batch = self.postgres_loader.batch
+        for start in range(0, len(ids), batch):
+            rows = self.postgres_loader.get_records_by_ids(
+                query=query, ids=ids[start : start + batch]
+            )
+            es_loader.bulk_actions(ColumnMapper(columns)(rows))
+        if deleted_ids:
+            es_loader.delete_documents(deleted_ids)
+        elif ids:
+            es_loader.bump_generation()
@@ -25,3 +25,67 @@ es_conf = [
         "port": os.getenv("ES_PORT"),
     }
 ]
+
+# Размер пачки, которую именованный курсор забирает с сервера PostgreSQL за раз
+PG_FETCH_SIZE: int = int(os.getenv("PG_FETCH_SIZE", 500))
+
+# Ограничения одного bulk-запроса в Elasticsearch: число документов и объём тела
+ES_BULK_SIZE: int = int(os.getenv("ES_BULK_SIZE", 500))
+ES_BULK_BYTES: int = int(os.getenv("ES_BULK_BYTES", 5 * 1024 * 1024))
+
+# Асинхронный конвейер: размер очередей между этапами и число параллельных bulk-запросов
+ETL_QUEUE_SIZE: int = int(os.getenv("ETL_QUEUE_SIZE", 4))
+ES_BULK_CONCURRENCY: int = int(os.getenv("ES_BULK_CONCURRENCY", 4))
+
+# Общие ограничения при параллельном запуске всех индексов
+PG_MAX_CONNECTIONS: int = int(os.getenv("PG_MAX_CONNECTIONS", 3))
+ES_MAX_BULK_REQUESTS: int = int(os.getenv("ES_MAX_BULK_REQUESTS", 6))
+
+# Число реплик, которое возвращается индексу после полной перезаливки
+ES_NUMBER_OF_REPLICAS: int = int(os.getenv("ES_NUMBER_OF_REPLICAS", 1))
+# Сколько секунд ждать слияния сегментов индекса после перезаливки
+ES_FORCEMERGE_TIMEOUT: int = int(os.getenv("ES_FORCEMERGE_TIMEOUT", 60 * 60))
+
+# Локальное хранилище хэшей проиндексированных документов
+ETL_HASH_STORE: str = os.getenv("ETL_HASH_STORE", "document_hashes.db")
+
+# CDC через логическую репликацию (плагин pgoutput)
+CDC_SLOT_NAME: str = os.getenv("CDC_SLOT_NAME", "etl_slot")
+CDC_PUBLICATION: str = os.getenv("CDC_PUBLICATION", "etl_publication")
+CDC_BATCH_SIZE: int = int(os.getenv("CDC_BATCH_SIZE", 500))
+CDC_FLUSH_INTERVAL: float = float(os.getenv("CDC_FLUSH_INTERVAL", 1))
+
+# Режим демона: интервал опроса индекса сокращается до минимума после найденных
+# изменений и растёт в ETL_POLL_BACKOFF раз на каждый пустой опрос
+ETL_POLL_MIN_INTERVAL: float = float(os.getenv("ETL_POLL_MIN_INTERVAL", 1))
+ETL_POLL_MAX_INTERVAL: float = float(os.getenv("ETL_POLL_MAX_INTERVAL", 60))
+ETL_POLL_BACKOFF: float = float(os.getenv("ETL_POLL_BACKOFF", 2))
+
+# Параллельная перезаливка movies: число диапазонов id и процессов-извлекателей
+ETL_PARTITIONS: int = int(os.getenv("ETL_PARTITIONS", 4))
+
+# Повтор элементов bulk-запроса, отклонённых с 429/503: число попыток
+# и границы паузы экспоненциального роста со случайным разбросом
+ES_BULK_RETRIES: int = int(os.getenv("ES_BULK_RETRIES", 5))
+ES_RETRY_START: float = float(os.getenv("ES_RETRY_START", 0.5))
+ES_RETRY_MAX: float = float(os.getenv("ES_RETRY_MAX", 30))
+
+# Файл документов, окончательно отклонённых Elasticsearch
+ETL_DEAD_LETTER_FILE: str = os.getenv("ETL_DEAD_LETTER_FILE", "dead_letters.ndjson")
+
+# Хранилище отметок: sqlite — все конвейеры в одном файле в режиме WAL,
+# json — файл на конвейер с атомарной записью через переименование
+ETL_STATE_BACKEND: str = os.getenv("ETL_STATE_BACKEND", "sqlite")
+ETL_STATE_DB: str = os.getenv("ETL_STATE_DB", "etl_state.db")
+
+# Метрики в формате Prometheus: файл для textfile collector и порт HTTP
+# в режиме демона; пустое значение или 0 выключают экспорт
+ETL_METRICS_FILE: str = os.getenv("ETL_METRICS_FILE", "")
+ETL_METRICS_PORT: int = int(os.getenv("ETL_METRICS_PORT", 0))
+
+# Redis API: после каждой загруженной пачки увеличивается поколение индекса,
+# по которому API сбрасывает кеш; пустой REDIS_HOST выключает счётчики
+REDIS_HOST: str = os.getenv("REDIS_HOST", "")
+REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+# Сколько секунд не обращаться к Redis после ошибки
+REDIS_RETRY_INTERVAL: float = float(os.getenv("REDIS_RETRY_INTERVAL", 30))
@@ -0,0 +1,89 @@
+import logging
+from datetime import datetime
+from typing import Callable
+
+import orjson
+from config import PG_FETCH_SIZE
+from psycopg2.extensions import connection as _connection
+
+logger = logging.getLogger("CopyExtractor")
+
+# Обработчик готовой пачки: документы и отметка последнего из них
+BatchHandler = Callable[[list[dict], dict], None]
+
+
+class CopySink:
+    """
+    Файлоподобный приёмник для copy_expert: PostgreSQL присылает поток
+    произвольными кусками, мы режем его на строки и собираем пачки документов.
+    Строка COPY — это JSON документа, updated_at и id через табуляцию.
+    """
+
+    def __init__(self, batch: int, on_batch: BatchHandler):
+        self.batch = batch
+        self.on_batch = on_batch
+        self.tail: bytes = b""
+        self.docs: list[dict] = []
+        self.checkpoint: dict = {}
+        self.count: int = 0
+
+    def write(self, data) -> int:
+        lines = (self.tail + bytes(data)).split(b"\n")
+        self.tail = lines.pop()
+        for line in lines:
+            doc, updated_at, last_id = line.split(b"\t")
+            # json_build_object экранирует управляющие символы, поэтому из
+            # экранирования текстового формата COPY в JSON встречается только \\
+            self.docs.append(orjson.loads(doc.replace(b"\\\\", b"\\")))
+            self.checkpoint = {
+                "updated_at": updated_at.decode(),
+                "last_id": last_id.decode(),
+            }
+            if len(self.docs) >= self.batch:
+                self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        if self.docs:
+            self.count += len(self.docs)
+            self.on_batch(self.docs, self.checkpoint)
+            self.docs = []
+
+
+class CopyExtractor:
+    """
+    Извлечение для полной перезаливки через COPY (...) TO STDOUT. Документ
+    собирает сам PostgreSQL в json_build_object, а не DictCursor построчно:
+    на запись приходится один orjson.loads без DictRow и приведения типов.
+    """
+
+    def __init__(self, pg_conn: _connection, columns: list[str], batch: int = PG_FETCH_SIZE):
+        self.conn = pg_conn
+        self.columns = columns
+        self.batch = batch
+
+    def copy_query(self, query: str, watermark: dict) -> str:
+        """
+        COPY не принимает параметры, поэтому отметка подставляется mogrify.
+        Порядок (updated_at, id) исходного запроса сохраняется.
+        """
+        fields = ", ".join(f"'{column}', t.{column}" for column in self.columns)
+        with self.conn.cursor() as cursor:
+            select = cursor.mogrify(query.strip().rstrip(";"), watermark).decode()
+        return (
+            f"COPY (SELECT json_build_object({fields}), t.updated_at, t.id"
+            f" FROM ({select}) t) TO STDOUT"
+        )
+
+    def extract(self, query: str, watermark: dict, on_batch: BatchHandler) -> int:
+        """
+        Потоково читаем результат запроса и отдаём пачки обработчику.
+        Возвращаем число прочитанных записей.
+        """
+        sink = CopySink(batch=self.batch, on_batch=on_batch)
+        with self.conn.cursor() as cursor:
+            cursor.copy_expert(self.copy_query(query, watermark), sink)
+        sink.flush()
+        self.conn.rollback()
+        logger.info(f"{datetime.now()}\n\nCOPY: прочитано {sink.count} записей")
+        return sink.count
@@ -0,0 +1,194 @@
+import logging
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import psycopg2
+from config import (
+    ETL_METRICS_FILE,
+    ETL_METRICS_PORT,
+    ETL_POLL_BACKOFF,
+    ETL_POLL_MAX_INTERVAL,
+    ETL_POLL_MIN_INTERVAL,
+    PG_FETCH_SIZE,
+    dsl,
+    es_conf,
+)
+from elasticsearch_loader import ElasticSearchLoader
+from hash_store import DocumentHashStore
+from metrics import metrics
+from postgres_loader import PostgresLoader
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import DictCursor
+from transform import ColumnMapper
+
+from services import backoff
+
+logger = logging.getLogger("Daemon")
+
+
+class PollSchedule:
+    """
+    Адаптивный интервал опроса одного индекса: после найденных изменений
+    опрашиваем часто, на каждом пустом опросе интервал растёт до максимума.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = ETL_POLL_MIN_INTERVAL,
+        max_interval: float = ETL_POLL_MAX_INTERVAL,
+        factor: float = ETL_POLL_BACKOFF,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval: float = min_interval
+        self.next_run: float = 0.0
+
+    def done(self, changed: int) -> None:
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.factor, self.max_interval)
+        self.next_run = time.monotonic() + self.interval
+
+
+class EtlDaemon:
+    """
+    Долгоживущий процесс инкрементальной загрузки. Одно соединение с PostgreSQL
+    и один клиент Elasticsearch живут всё время работы, а не создаются
+    на каждую пачку. По SIGTERM/SIGINT дозагружает текущую пачку, сохраняет
+    её отметку и завершается.
+    """
+
+    def __init__(
+        self,
+        pipelines: list[dict],
+        batch: int = PG_FETCH_SIZE,
+        hash_store: Optional[DocumentHashStore] = None,
+    ):
+        self.pipelines = pipelines
+        self.batch = batch
+        self.stop_event = threading.Event()
+        self.pg_conn: Optional[_connection] = None
+        self.es_client = ElasticSearchLoader.make_client(es_conf)
+        self.loaders: dict[str, ElasticSearchLoader] = {
+            pipeline["index_name"]: ElasticSearchLoader(
+                host=es_conf,
+                index_name=pipeline["index_name"],
+                hash_store=hash_store,
+                client=self.es_client,
+            )
+            for pipeline in pipelines
+        }
+        self.mappers: dict[str, ColumnMapper] = {
+            pipeline["index_name"]: ColumnMapper(pipeline["columns"])
+            for pipeline in pipelines
+        }
+        self.schedules: dict[str, PollSchedule] = {
+            pipeline["index_name"]: PollSchedule() for pipeline in pipelines
+        }
+
+    @backoff()
+    def connect_postgres(self) -> _connection:
+        return psycopg2.connect(**dsl, cursor_factory=DictCursor)
+
+    def get_connection(self) -> _connection:
+        """
+        Переподключаемся только если прежнее соединение закрылось.
+        """
+        if self.pg_conn is None or self.pg_conn.closed:
+            self.pg_conn = self.connect_postgres()
+            logger.info(f"{datetime.now()}\n\nустановлена связь с PostgreSQL")
+        return self.pg_conn
+
+    def stop(self, signum, frame) -> None:
+        logger.info(
+            f"{datetime.now()}\n\nполучен сигнал {signum}, завершаем после текущей пачки"
+        )
+        self.stop_event.set()
+
+    def poll(
+        self, columns: list[str], state_file: str, query: str, index_name: str, **kwargs
+    ) -> int:
+        """
+        Один проход инкрементальной загрузки индекса. Возвращает число
+        прочитанных записей. Отметка сохраняется после каждой пачки, поэтому
+        остановка между пачками ничего не теряет.
+        """
+        pg_conn = self.get_connection()
+        es_loader = self.loaders[index_name]
+        to_docs = self.mappers[index_name]
+        postgres_loader = PostgresLoader(pg_conn, state_file=state_file, batch=self.batch)
+        changed: int = 0
+        watch = metrics.stopwatch(index_name)
+        try:
+            for rows in postgres_loader.iter_batches(
+                query=query, cursor_name=f"{index_name}_cursor"
+            ):
+                watch.lap("extract")
+                actions = to_docs(rows)
+                watch.lap("transform")
+                es_loader.load_data_to_elasticsearch(
+                    actions=actions,
+                    state_file=state_file,
+                    checkpoint=PostgresLoader.batch_checkpoint(rows),
+                )
+                changed += len(rows)
+                watch.reset()
+                if self.stop_event.is_set():
+                    break
+        finally:
+            # Не держим открытую транзакцию между опросами
+            if not pg_conn.closed:
+                pg_conn.rollback()
+        if changed:
+            # Делаем пачки видимыми поиску до следующего опроса: refresh ещё раз
+            # увеличивает поколение кеша API
+            es_loader.refresh_index()
+            logger.info(f"{datetime.now()}\n\n{index_name}: загружено {changed} записей")
+        return changed
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for pipeline in self.pipelines:
+            self.loaders[pipeline["index_name"]].create_index(
+                index_schema=pipeline["index_schema"]
+            )
+        logger.info(f"{datetime.now()}\n\nзапуск ETL в режиме демона")
+        if ETL_METRICS_PORT:
+            metrics.serve(ETL_METRICS_PORT)
+        try:
+            while not self.stop_event.is_set():
+                for pipeline in self.pipelines:
+                    schedule = self.schedules[pipeline["index_name"]]
+                    if self.stop_event.is_set() or time.monotonic() < schedule.next_run:
+                        continue
+                    try:
+                        changed = self.poll(**pipeline)
+                    except psycopg2.Error as e:
+                        # Соединение пересоздадим на следующем опросе
+                        logger.error(f"{datetime.now()}\n\nошибка PostgreSQL: {e!r}")
+                        if self.pg_conn is not None:
+                            self.pg_conn.close()
+                        changed = 0
+                    except Exception as e:
+                        # backoff уже исчерпал попытки: пробуем на следующем опросе
+                        logger.error(
+                            f"{datetime.now()}\n\n{pipeline['index_name']}: {e!r}"
+                        )
+                        changed = 0
+                    schedule.done(changed=changed)
+                metrics.export(ETL_METRICS_FILE)
+                next_run = min(schedule.next_run for schedule in self.schedules.values())
+                self.stop_event.wait(max(next_run - time.monotonic(), 0))
+        finally:
+            if self.pg_conn is not None:
+                self.pg_conn.close()
+            self.es_client.close()
+            for loader in self.loaders.values():
+                loader.report_counts()
+            logger.info(f"{datetime.now()}\n\nETL остановлен")
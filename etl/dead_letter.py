@@ -0,0 +1,93 @@
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Iterator
+
+import orjson
+from config import ES_BULK_SIZE, ETL_DEAD_LETTER_FILE
+
+logger = logging.getLogger("DeadLetter")
+
+
+def split_bulk_items(body: bytes) -> list[bytes]:
+    """
+    Режем NDJSON-тело bulk-запроса на элементы в порядке ответа Elasticsearch:
+    delete занимает одну строку, index и update — строку action и строку документа.
+    """
+    lines = bytes(body).split(b"\n")
+    items: list[bytes] = []
+    number: int = 0
+    while number < len(lines) and lines[number]:
+        if lines[number].startswith(b'{"delete"'):
+            items.append(lines[number] + b"\n")
+            number += 1
+        else:
+            items.append(lines[number] + b"\n" + lines[number + 1] + b"\n")
+            number += 2
+    return items
+
+
+class DeadLetterFile:
+    """
+    Документы, которые Elasticsearch отклонил окончательно, дописываются
+    в NDJSON-файл вместе с ошибкой, чтобы их можно было разобрать
+    и повторно отправить командой --replay-dead-letters.
+    """
+
+    def __init__(self, path: str = ETL_DEAD_LETTER_FILE):
+        self.path = path
+
+    def write(self, index_name: str, item: bytes, result: dict) -> None:
+        action, _, source = item.rstrip(b"\n").partition(b"\n")
+        record = {
+            "index_name": index_name,
+            "status": result.get("status"),
+            "error": result.get("error"),
+            "failed_at": f"{datetime.now()}",
+            "action": orjson.loads(action),
+            "source": orjson.loads(source) if source else None,
+        }
+        with open(self.path, "ab") as f:
+            f.write(orjson.dumps(record) + b"\n")
+
+    def iter_records(self, path: str) -> Iterator[dict]:
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+
+    def replay(
+        self, send_bulk: Callable[[str, bytes], set], chunk_size: int = ES_BULK_SIZE
+    ) -> int:
+        """
+        Повторно отправляем отклонённые документы. Файл сначала переименовывается:
+        то, что снова не загрузится, попадёт в новый файл, а не в читаемый.
+        Возвращаем число отправленных документов.
+        """
+        replay_path = f"{self.path}.replay"
+        # Незавершённый прошлый повтор доделываем первым
+        if not os.path.exists(replay_path):
+            if not os.path.exists(self.path):
+                logger.info(f"{datetime.now()}\n\nнет отклонённых документов")
+                return 0
+            os.replace(self.path, replay_path)
+        items: dict[str, list[bytes]] = defaultdict(list)
+        for record in self.iter_records(replay_path):
+            item = orjson.dumps(record["action"]) + b"\n"
+            if record["source"] is not None:
+                item += orjson.dumps(record["source"]) + b"\n"
+            items[record["index_name"]].append(item)
+        sent: int = 0
+        for index_name, index_items in items.items():
+            for start in range(0, len(index_items), chunk_size):
+                chunk = index_items[start : start + chunk_size]
+                failed = send_bulk(index_name, b"".join(chunk))
+                sent += len(chunk)
+                logger.info(
+                    f"{datetime.now()}\n\n{index_name}: повторно отправлено {len(chunk)},"
+                    f" снова отклонено {len(failed)}"
+                )
+        os.remove(replay_path)
+        return sent
+
@@ -0,0 +1,180 @@
+import logging
+from datetime import datetime
+from typing import Iterator, Optional
+
+from config import ES_BULK_SIZE
+from elasticsearch_loader import ElasticSearchLoader
+from pipelines import film_work_columns, person_columns
+from postgres_loader import MIN_ID
+from psycopg2.extensions import connection as _connection
+from query import (
+    film_work_by_ids_query,
+    film_work_existing_ids_query,
+    film_work_ids_query,
+    genre_existing_ids_query,
+    genre_ids_query,
+    person_by_ids_query,
+    person_existing_ids_query,
+    person_ids_query,
+)
+from transform import ColumnMapper
+
+logger = logging.getLogger("DeleteSync")
+
+
+class DeleteSync:
+    """
+    Перенос удалений из PostgreSQL в Elasticsearch. id обеих сторон читаются
+    страницами в одном порядке и сравниваются слиянием, поэтому в памяти
+    держится только по странице с каждой стороны. Документы, которые
+    ссылались на удалённые, перечитываются из PostgreSQL.
+    """
+
+    def __init__(
+        self,
+        pg_conn: _connection,
+        loaders: dict[str, ElasticSearchLoader],
+        chunk_size: int = ES_BULK_SIZE,
+    ):
+        self.conn = pg_conn
+        self.loaders = loaders
+        self.chunk_size = chunk_size
+
+    def iter_postgres_ids(self, query: str) -> Iterator[str]:
+        after: str = MIN_ID
+        with self.conn.cursor() as cursor:
+            while True:
+                cursor.execute(query, {"after": after, "limit": self.chunk_size})
+                ids = [record[0] for record in cursor.fetchall()]
+                if not ids:
+                    return
+                yield from ids
+                after = ids[-1]
+
+    def iter_elastic_ids(self, index_name: str, query: Optional[dict] = None) -> Iterator[str]:
+        """
+        id документов индекса по возрастанию. Строковый порядок uuid
+        совпадает с порядком uuid в PostgreSQL.
+        """
+        client = self.loaders[index_name].client
+        body: dict = {
+            "size": self.chunk_size,
+            "_source": False,
+            "sort": [{"id": "asc"}],
+            "query": query or {"match_all": {}},
+        }
+        while True:
+            hits = client.search(index=index_name, body=body)["hits"]["hits"]
+            if not hits:
+                return
+            for hit in hits:
+                yield hit["_id"]
+            body["search_after"] = hits[-1]["sort"]
+
+    def still_missing(self, exists_query: str, ids: list[str]) -> list[str]:
+        """
+        Страница id PostgreSQL прочитана раньше страниц индекса: запись,
+        добавленная и проиндексированная за время сверки, в неё не попала.
+        Удаляем только те id, которых нет в PostgreSQL и сейчас.
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(exists_query, {"ids": ids})
+            existing = {record[0] for record in cursor.fetchall()}
+        return [doc_id for doc_id in ids if doc_id not in existing]
+
+    def iter_removed_ids(
+        self, query: str, exists_query: str, index_name: str
+    ) -> Iterator[list[str]]:
+        """
+        Слияние двух отсортированных потоков id: есть в индексе, но нет
+        в PostgreSQL — значит удалён. Кандидаты перепроверяются пачками
+        по chunk_size (см. still_missing).
+        """
+        postgres_ids = self.iter_postgres_ids(query)
+        postgres_id: Optional[str] = next(postgres_ids, None)
+        candidates: list[str] = []
+        for elastic_id in self.iter_elastic_ids(index_name):
+            while postgres_id is not None and postgres_id < elastic_id:
+                postgres_id = next(postgres_ids, None)
+            if postgres_id != elastic_id:
+                candidates.append(elastic_id)
+            if len(candidates) >= self.chunk_size:
+                removed = self.still_missing(exists_query, candidates)
+                if removed:
+                    yield removed
+                candidates = []
+        if candidates:
+            removed = self.still_missing(exists_query, candidates)
+            if removed:
+                yield removed
+
+    def reindex(
+        self, index_name: str, columns: list[str], query: str, ids: list[str]
+    ) -> None:
+        for start in range(0, len(ids), self.chunk_size):
+            with self.conn.cursor() as cursor:
+                cursor.execute(query, {"ids": ids[start : start + self.chunk_size]})
+                rows = cursor.fetchall()
+            self.loaders[index_name].bulk_actions(ColumnMapper(columns)(rows))
+            self.loaders[index_name].bump_generation()
+
+    def delete_films(self) -> None:
+        for removed in self.iter_removed_ids(
+            film_work_ids_query, film_work_existing_ids_query, "movies"
+        ):
+            self.loaders["movies"].delete_documents(removed)
+            # Из фильмографии персон удалённые фильмы уходят перечитыванием персон
+            persons = list(
+                self.iter_elastic_ids("person", {"terms": {"film_ids": removed}})
+            )
+            self.reindex("person", person_columns, person_by_ids_query, persons)
+
+    def delete_persons(self) -> None:
+        for removed in self.iter_removed_ids(
+            person_ids_query, person_existing_ids_query, "person"
+        ):
+            self.loaders["person"].delete_documents(removed)
+            # Перечитанные фильмы больше не содержат удалённых персон ни во
+            # вложенных actors/writers/directors, ни в списках имён
+            films_query = {
+                "bool": {
+                    "should": [
+                        {
+                            "nested": {
+                                "path": role,
+                                "query": {"terms": {f"{role}.id": removed}},
+                            }
+                        }
+                        for role in ("actors", "writers", "directors")
+                    ]
+                }
+            }
+            films = list(self.iter_elastic_ids("movies", films_query))
+            self.reindex("movies", film_work_columns, film_work_by_ids_query, films)
+
+    def delete_genres(self) -> None:
+        client = self.loaders["genre"].client
+        for removed in self.iter_removed_ids(
+            genre_ids_query, genre_existing_ids_query, "genre"
+        ):
+            # Фильмы хранят только названия жанров, берём их до удаления
+            docs = client.mget(index="genre", body={"ids": removed})["docs"]
+            names = [doc["_source"]["name"] for doc in docs if doc.get("found")]
+            self.loaders["genre"].delete_documents(removed)
+            if not names:
+                continue
+            films_query = {
+                "bool": {"should": [{"match_phrase": {"genre": name}} for name in names]}
+            }
+            films = list(self.iter_elastic_ids("movies", films_query))
+            self.reindex("movies", film_work_columns, film_work_by_ids_query, films)
+
+    def run(self) -> None:
+        logger.info(f"{datetime.now()}\n\nсверка удалённых записей")
+        self.delete_films()
+        self.delete_persons()
+        self.delete_genres()
+        self.conn.rollback()
+        for loader in self.loaders.values():
+            loader.refresh_index()
+            loader.report_counts()
@@ -1,21 +1,93 @@
-import json
+import asyncio
 import logging
+import time
 from datetime import datetime
+from itertools import chain
+from typing import Iterable, Iterator, Optional, Union
 
-from elasticsearch import Elasticsearch
-from state import JsonFileStorage, State
+from config import (
+    ES_BULK_BYTES,
+    ES_BULK_RETRIES,
+    ES_BULK_SIZE,
+    ES_FORCEMERGE_TIMEOUT,
+    ES_NUMBER_OF_REPLICAS,
+    ES_RETRY_MAX,
+    ES_RETRY_START,
+)
+from dead_letter import DeadLetterFile, split_bulk_items
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch.serializer import JSONSerializer
+from generation import generations
+from hash_store import DocumentHashStore
+from metrics import metrics
+from state import State, make_storage
+from transform import BulkBuffer, dumps
 
-from services import backoff
+from services import async_backoff, backoff, backoff_delays
 
 logger = logging.getLogger("ESLoader")
 
+# Тело bulk-запроса уходит в транспорт как есть, без client.bulk
+BULK_HEADERS: dict = {"content-type": "application/x-ndjson"}
+
+# Статусы элементов bulk-запроса, которые стоит повторить: перегрузка кластера
+RETRYABLE_STATUSES: frozenset = frozenset({429, 503})
+
+
+class RawBodySerializer(JSONSerializer):
+    """
+    Готовые байты (в том числе bytearray буфера bulk) передаются транспорту
+    без копирования и повторной сериализации.
+    """
+
+    def dumps(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return data
+        return super().dumps(data)
+
 
 class ElasticSearchLoader:
-    def __init__(self, host: list, index_name: str, state_key="key"):
-        self.client = Elasticsearch(host)
-        self.data = []
+    client_class = Elasticsearch
+
+    @classmethod
+    def make_client(cls, host: list):
+        return cls.client_class(host, serializer=RawBodySerializer())
+
+    def __init__(
+        self,
+        host: list,
+        index_name: str,
+        state_key="key",
+        chunk_size: int = ES_BULK_SIZE,
+        max_chunk_bytes: int = ES_BULK_BYTES,
+        partial_fields: Optional[list[str]] = None,
+        hash_store: Optional[DocumentHashStore] = None,
+        client: Optional[Elasticsearch] = None,
+        dead_letters: Optional[DeadLetterFile] = None,
+    ):
+        # Долгоживущий процесс передаёт один общий клиент со своим пулом соединений
+        self.client = client or self.make_client(host)
         self.index_name = index_name
         self.key = state_key
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        # Если заданы поля, документы не перезаписываются целиком,
+        # а частично обновляются только этими полями
+        self.partial_fields = partial_fields
+        # Хэши описывают только полные документы: частичное обновление
+        # их не сохраняет, а стирает (см. select_changed)
+        self.hash_store = hash_store
+        self.dead_letters = dead_letters or DeadLetterFile()
+        self.written: int = 0
+        self.skipped: int = 0
+        self.deleted: int = 0
+        self.retried: int = 0
+        self.rejected: int = 0
+        # Начало строки action без _id собирается один раз на индекс
+        self.action_prefix: bytes = (
+            b'{"update"' if partial_fields else b'{"index"'
+        ) + b':{"_index":' + dumps(index_name) + b',"_id":'
+        self.buffer = BulkBuffer()
 
     @backoff()
     def create_index(self, index_schema: dict) -> None:
@@ -28,8 +100,9 @@ class ElasticSearchLoader:
             result = self.client.indices.create(
                 index=index, ignore=400, body=index_schema
             )
-            if result.get("status") == 200:
+            if result.get("acknowledged"):
                 logger.info(f"\nиндекс {index} создан\t{datetime.now()}\n")
+                self.forget_hashes()
             else:
                 logger.info(
                     f"\nиндекс {index} создан не был, ошибка 400\t{datetime.now()}\n"
@@ -37,21 +110,465 @@ class ElasticSearchLoader:
         else:
             logger.warning(f"\nиндекс {index} был создан ранее\t{datetime.now()}\n")
 
+    def forget_hashes(self) -> None:
+        """
+        Индекс создан заново и пуст: сохранённые хэши описывают документы
+        прежнего индекса, и без очистки вся перезаливка была бы отброшена
+        как неизменившаяся.
+        """
+        if self.hash_store:
+            self.hash_store.clear(index_name=self.index_name)
+
     @backoff()
-    def bulk_data_to_elasticsearch(self) -> None:
-        self.client.bulk(index=self.index_name, body=self.data, refresh=True)
+    def create_versioned_index(self, index_schema: dict) -> str:
+        """
+        Создаём новую версию индекса (movies_v2, movies_v3, ...) для полной
+        перезаливки: без обновления и реплик, чтобы bulk-загрузка шла быстрее.
+        """
+        suffixes = [
+            name.rsplit("_v", 1)[1]
+            for name in self.client.indices.get(index=f"{self.index_name}_v*")
+        ]
+        versions = [int(suffix) for suffix in suffixes if suffix.isdigit()]
+        index = f"{self.index_name}_v{max(versions, default=1) + 1}"
+        settings = {
+            **index_schema["settings"],
+            "refresh_interval": "-1",
+            "number_of_replicas": 0,
+        }
+        self.client.indices.create(
+            index=index, body={**index_schema, "settings": settings}
+        )
+        logger.info(f"\nиндекс {index} создан для перезаливки\t{datetime.now()}\n")
+        return index
+
+    def publish_index(self, index: str, index_schema: dict) -> None:
+        """
+        Завершаем перезаливку: возвращаем настройки индекса, сливаем сегменты
+        и атомарно переключаем на него псевдоним, из которого читает API.
+        Версия, опубликованная до этого, остаётся для отката, остальные удаляются.
+        Повторяется каждый шаг отдельно, а не вся последовательность.
+        """
+        self.restore_index_settings(index=index, index_schema=index_schema)
+        self.forcemerge_index(index=index)
+        previous = self.switch_alias(index=index)
+        self.bump_generation()
+        self.delete_old_versions(index=index, previous=previous)
+
+    @backoff()
+    def restore_index_settings(self, index: str, index_schema: dict) -> None:
+        self.client.indices.put_settings(
+            index=index,
+            body={
+                "index": {
+                    "refresh_interval": index_schema["settings"]["refresh_interval"],
+                    "number_of_replicas": ES_NUMBER_OF_REPLICAS,
+                }
+            },
+        )
+
+    @backoff()
+    def forcemerge_index(self, index: str) -> None:
+        """
+        Слияние большого индекса идёт минуты, поэтому ждём его дольше
+        обычного тайм-аута запроса. Повтор безопасен: уже слитый индекс
+        сливать нечего.
+        """
+        self.client.indices.forcemerge(
+            index=index, max_num_segments=1, request_timeout=ES_FORCEMERGE_TIMEOUT
+        )
+        self.client.indices.refresh(index=index)
+
+    @backoff()
+    def alias_indices(self) -> list[str]:
+        alias = self.index_name
+        current = self.client.indices.get_alias(name=alias, ignore=404)
+        return [name for name in current if name not in ("error", "status")]
+
+    def switch_alias(self, index: str) -> Optional[str]:
+        """
+        Переключаем псевдоним на index и возвращаем индекс, на который он
+        указывал до этого (None, если такого нет), — это версия для отката.
+        Прежнее состояние читается один раз до переключения, повторяется
+        только само переключение.
+        """
+        current = self.alias_indices()
+        previous = next((name for name in current if name != index), None)
+        if index not in current:
+            self.update_alias(index=index)
+        return previous
+
+    @backoff()
+    def update_alias(self, index: str) -> None:
+        """
+        Состояние псевдонима перечитывается на каждой попытке: если прошлая
+        попытка переключила его, а ответ потерялся, делать нечего.
+        """
+        alias = self.index_name
+        current = self.alias_indices()
+        if index in current:
+            return
+        actions: list[dict] = [
+            {"remove": {"index": name, "alias": alias}} for name in current
+        ]
+        if not current and self.client.indices.exists(index=alias):
+            # Индекс с именем псевдонима создан до перехода на версии
+            actions.append({"remove_index": {"index": alias}})
+        actions.append({"add": {"index": index, "alias": alias}})
+        self.client.indices.update_aliases(body={"actions": actions})
+        logger.info(f"\nпсевдоним {alias} переключён на {index}\t{datetime.now()}\n")
+
+    @backoff()
+    def delete_old_versions(self, index: str, previous: Optional[str]) -> None:
+        """
+        Оставляем опубликованную версию и ту, на которую псевдоним указывал
+        до переключения, — она остаётся для отката. Остальные версии, включая
+        недостроенные после неудачных перезаливок, удаляются.
+        """
+        for name in self.client.indices.get(index=f"{self.index_name}_v*"):
+            if name in (index, previous) or not name.rsplit("_v", 1)[1].isdigit():
+                continue
+            self.client.indices.delete(index=name, ignore=404)
+
+    @backoff()
+    def bulk_data_to_elasticsearch(self, body: Union[bytes, bytearray]) -> dict:
+        return self.client.transport.perform_request(
+            "POST", "/_bulk", headers=BULK_HEADERS, body=body
+        )
+
+    @backoff()
+    def refresh_index(self) -> None:
+        """
+        Однократно делаем загруженные документы видимыми для поиска.
+        """
+        self.client.indices.refresh(index=self.index_name)
+        self.bump_generation()
+
+    def make_action(self, row: dict) -> tuple[bytes, bytes]:
+        """
+        Пара строк bulk-запроса для документа. index создаёт документ или
+        заменяет существующий, update с partial_fields отправляет только
+        изменившиеся поля и не создаёт неполных документов.
+        """
+        action = self.action_prefix + dumps(f"{row['id']}") + b"}}"
+        if self.partial_fields:
+            return action, dumps(
+                {"doc": {field: row[field] for field in self.partial_fields}}
+            )
+        return action, dumps(row)
+
+    def iter_bulk_bodies(
+        self, actions: Iterable[dict], reuse: bool = False
+    ) -> Iterator[Union[bytes, bytearray]]:
+        """
+        Собираем NDJSON-тела bulk-запросов, ограниченные по числу документов
+        и по объёму в байтах. С reuse отдаётся один и тот же буфер загрузчика:
+        его нужно отправить до следующей итерации. Без reuse — копии в bytes
+        для передачи в очередь или другой процесс.
+        """
+        buffer = self.buffer if reuse else BulkBuffer()
+        buffer.clear()
+        for row in actions:
+            action, doc = self.make_action(row)
+            if buffer.count and (
+                buffer.count >= self.chunk_size
+                or len(buffer) + len(action) + len(doc) + 2 > self.max_chunk_bytes
+            ):
+                yield buffer.buffer if reuse else bytes(buffer.buffer)
+                buffer.clear()
+            buffer.append(action, doc)
+        if buffer.count:
+            yield buffer.buffer if reuse else bytes(buffer.buffer)
+            buffer.clear()
+
+    def is_missing_document(self, result: dict) -> bool:
+        """
+        Частичное обновление не создаёт документов: фильма, которого ещё
+        нет в индексе, обновлять нечего, он попадёт туда полной загрузкой.
+        """
+        error = result.get("error")
+        return (
+            bool(self.partial_fields)
+            and result.get("status") == 404
+            and isinstance(error, dict)
+            and error.get("type") == "document_missing_exception"
+        )
+
+    def check_bulk_response(
+        self, body: bytes, response: dict, final: bool = False
+    ) -> tuple[bytes, set[str]]:
+        """
+        Разбираем ответ bulk-запроса по элементам. Отклонённые с 429/503
+        собираем в тело повторного запроса, остальные ошибки окончательные:
+        документ логируется и уходит в файл отклонённых. С final повторов
+        больше не будет, и в файл уходят все неуспешные элементы.
+        Частичные обновления отсутствующих документов только пропускаются.
+        Возвращаем тело повтора и id незаписанных документов.
+        """
+        if not response.get("errors"):
+            return b"", set()
+        retry: list[bytes] = []
+        rejected: set[str] = set()
+        missing: set[str] = set()
+        for item, result in zip(split_bulk_items(body), response["items"]):
+            result = next(iter(result.values()))
+            if not result.get("error"):
+                continue
+            if self.is_missing_document(result):
+                missing.add(f"{result.get('_id')}")
+                continue
+            if result.get("status") in RETRYABLE_STATUSES and not final:
+                retry.append(item)
+                continue
+            rejected.add(f"{result.get('_id')}")
+            self.dead_letters.write(index_name=self.index_name, item=item, result=result)
+            logger.error(
+                f"{datetime.now()}\n\nдокумент {result.get('_id')} индекса "
+                f"{self.index_name} не загружен: {result.get('status')} "
+                f"{result.get('error')}"
+            )
+        self.rejected += len(rejected)
+        self.skipped += len(missing)
+        self.retried += len(retry)
+        metrics.count_documents(self.index_name, "rejected", len(rejected))
+        metrics.count_documents(self.index_name, "skipped", len(missing))
+        metrics.count_bulk(self.index_name, size=0, retries=len(retry))
+        return b"".join(retry), rejected | missing
+
+    def retry_delays(self) -> Iterator[Optional[float]]:
+        """
+        Паузы перед повторами; None отмечает последнюю попытку.
+        """
+        return chain(
+            backoff_delays(
+                start_sleep_time=ES_RETRY_START,
+                border_sleep_time=ES_RETRY_MAX,
+                max_tries=ES_BULK_RETRIES,
+            ),
+            [None],
+        )
+
+    def send_bulk(self, body: Union[bytes, bytearray]) -> set[str]:
+        """
+        Отправляем тело и повторяем только элементы, отклонённые с 429/503.
+        Возвращаем id незаписанных документов.
+        """
+        failed: set[str] = set()
+        watch = metrics.stopwatch(self.index_name)
+        for delay in self.retry_delays():
+            metrics.count_bulk(self.index_name, size=len(body))
+            response = self.bulk_data_to_elasticsearch(body=body)
+            body, rejected = self.check_bulk_response(
+                body=body, response=response, final=delay is None
+            )
+            failed |= rejected
+            if not body:
+                break
+            time.sleep(delay)
+        watch.lap("bulk")
+        return failed
+
+    def select_changed(self, actions: list) -> tuple[list, dict[str, bytes]]:
+        """
+        Отбрасываем документы, которые не изменились с последней записи.
+        Частичное обновление меняет документ в индексе мимо его хэша, поэтому
+        хэши этих документов стираются: следующая полная запись уйдёт всегда,
+        даже если совпадёт с документом до частичного обновления.
+        """
+        if not self.hash_store:
+            return actions, {}
+        if self.partial_fields:
+            self.hash_store.forget(
+                index_name=self.index_name, ids=[f"{row['id']}" for row in actions]
+            )
+            return actions, {}
+        changed, hashes = self.hash_store.select_changed(
+            index_name=self.index_name, docs=actions
+        )
+        self.skipped += len(actions) - len(changed)
+        metrics.count_documents(self.index_name, "skipped", len(actions) - len(changed))
+        return changed, hashes
 
-    def load_data_to_elasticsearch(self, actions: list, state_file: str) -> None:
+    def remember(self, sent: int, hashes: dict[str, bytes], failed: set[str]) -> None:
+        """
+        Учитываем документы, которые Elasticsearch принял, и запоминаем их хэши.
+        """
+        self.written += sent - len(failed)
+        metrics.count_documents(self.index_name, "written", sent - len(failed))
+        if self.hash_store and hashes:
+            self.hash_store.save(
+                index_name=self.index_name,
+                hashes={
+                    doc_id: doc_hash
+                    for doc_id, doc_hash in hashes.items()
+                    if doc_id not in failed
+                },
+            )
+
+    def report_counts(self) -> None:
+        logger.info(
+            f"{datetime.now()}\n\nиндекс {self.index_name}: записано {self.written}, "
+            f"пропущено без изменений {self.skipped}, удалено {self.deleted}, "
+            f"повторено {self.retried}, отклонено {self.rejected}"
+        )
+
+    def bulk_actions(self, actions: list) -> None:
         """
         Загружаем данные пачками в Elasticsearch предварительно присваивая записям id.
+        Одна пачка — один bulk-запрос, обновление индекса остаётся на его настройках.
+        """
+        watch = metrics.stopwatch(self.index_name)
+        actions, hashes = self.select_changed(actions)
+        failed: set[str] = set()
+        for body in self.iter_bulk_bodies(actions, reuse=True):
+            watch.lap("transform")
+            failed |= self.send_bulk(body)
+            # Время bulk учтено в send_bulk
+            watch.reset()
+        self.remember(sent=len(actions), hashes=hashes, failed=failed)
+        watch.lap("transform")
+
+    def iter_delete_bodies(self, ids: list[str]) -> Iterator[bytes]:
+        for start in range(0, len(ids), self.chunk_size):
+            yield b"".join(
+                dumps({"delete": {"_index": self.index_name, "_id": doc_id}}) + b"\n"
+                for doc_id in ids[start : start + self.chunk_size]
+            )
+
+    def delete_documents(self, ids: list[str]) -> None:
+        """
+        Удаляем документы bulk-запросами delete. Уже отсутствующий документ
+        Elasticsearch возвращает как not_found без ошибки.
+        """
+        failed: set[str] = set()
+        for body in self.iter_delete_bodies(ids):
+            failed |= self.send_bulk(body)
+        self.deleted += len(ids) - len(failed)
+        metrics.count_documents(self.index_name, "deleted", len(ids) - len(failed))
+        self.bump_generation()
+        if self.hash_store:
+            self.hash_store.forget(
+                index_name=self.index_name,
+                ids=[doc_id for doc_id in ids if doc_id not in failed],
+            )
+
+    def load_data_to_elasticsearch(
+        self,
+        actions: list,
+        state_file: str,
+        checkpoint: dict,
+        state_key: Optional[str] = None,
+    ) -> None:
         """
-        data_json = json.dumps(actions)
-        load_json = json.loads(data_json)
-        for row in load_json:
-            self.data.append({"create": {"_index": self.index_name, "_id": row["id"]}})
-            self.data.append(row)
-            self.bulk_data_to_elasticsearch()
-            self.data.clear()
-        State(storage=JsonFileStorage(file_path=state_file)).set_state(
-            key=f"{self.key}", value=f"{datetime.now()}"
+        Загружаем пачку и после её подтверждения сохраняем отметку (updated_at, id).
+        """
+        self.bulk_actions(actions)
+        self.save_checkpoint(state_file, checkpoint, state_key)
+
+    def save_checkpoint(
+        self, state_file: str, checkpoint: dict, state_key: Optional[str] = None
+    ) -> None:
+        watch = metrics.stopwatch(self.index_name)
+        State(storage=make_storage(state_file)).set_state(
+            key=state_key or f"{self.key}", value=checkpoint
+        )
+        watch.lap("checkpoint")
+        metrics.observe_checkpoint(self.index_name, checkpoint)
+        self.bump_generation()
+
+    def bump_generation(self) -> None:
+        """
+        Сбрасываем кеш API по индексу. Запись становится видна поиску только
+        после обновления индекса (refresh_interval), поэтому refresh_index
+        увеличивает поколение ещё раз: ответ, закешированный в этом окне,
+        не переживёт его.
+        """
+        generations.bump(self.index_name)
+
+
+class AsyncElasticSearchLoader(ElasticSearchLoader):
+    """
+    Загрузчик для асинхронного конвейера: сборка NDJSON-тел и разбор ответов
+    общие с ElasticSearchLoader, запросы идут через AsyncElasticsearch.
+    """
+
+    client_class = AsyncElasticsearch
+
+    @async_backoff()
+    async def create_index(self, index_schema: dict) -> None:
+        """
+        Создаем индекс для Elasticsearch.
+        """
+        index = self.index_name
+        if await self.client.indices.exists(index=index):
+            logger.warning(f"\nиндекс {index} был создан ранее\t{datetime.now()}\n")
+            return
+        result = await self.client.indices.create(
+            index=index, ignore=400, body=index_schema
         )
+        if result.get("acknowledged"):
+            logger.info(f"\nиндекс {index} создан\t{datetime.now()}\n")
+            self.forget_hashes()
+        else:
+            logger.info(
+                f"\nиндекс {index} создан не был, ошибка 400\t{datetime.now()}\n"
+            )
+
+    @async_backoff()
+    async def bulk_data_to_elasticsearch(self, body: Union[bytes, bytearray]) -> dict:
+        return await self.client.transport.perform_request(
+            "POST", "/_bulk", headers=BULK_HEADERS, body=body
+        )
+
+    @async_backoff()
+    async def refresh_index(self) -> None:
+        await self.client.indices.refresh(index=self.index_name)
+        self.bump_generation()
+
+    async def send_bulk(self, body: Union[bytes, bytearray]) -> set[str]:
+        failed: set[str] = set()
+        watch = metrics.stopwatch(self.index_name)
+        for delay in self.retry_delays():
+            metrics.count_bulk(self.index_name, size=len(body))
+            response = await self.bulk_data_to_elasticsearch(body=body)
+            body, rejected = self.check_bulk_response(
+                body=body, response=response, final=delay is None
+            )
+            failed |= rejected
+            if not body:
+                break
+            await asyncio.sleep(delay)
+        watch.lap("bulk")
+        return failed
+
+    async def bulk_actions(self, actions: list) -> None:
+        watch = metrics.stopwatch(self.index_name)
+        actions, hashes = self.select_changed(actions)
+        failed: set[str] = set()
+        for body in self.iter_bulk_bodies(actions):
+            watch.lap("transform")
+            failed |= await self.send_bulk(body)
+            watch.reset()
+        self.remember(sent=len(actions), hashes=hashes, failed=failed)
+        watch.lap("transform")
+
+    async def load_data_to_elasticsearch(
+        self,
+        actions: list,
+        state_file: str,
+        checkpoint: dict,
+        state_key: Optional[str] = None,
+    ) -> None:
+        await self.bulk_actions(actions)
+        self.save_checkpoint(state_file, checkpoint, state_key)
+
+    def bump_generation(self) -> None:
+        """
+        Синхронный INCR заблокировал бы цикл событий: увеличение уходит
+        в поток, а частые подтверждения пачек сливаются (см. bump_soon).
+        """
+        generations.bump_soon(self.index_name)
+
+    async def close(self) -> None:
+        await generations.wait()
+        await self.client.close()
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import redis
+from config import REDIS_HOST, REDIS_PORT, REDIS_RETRY_INTERVAL
+
+logger = logging.getLogger("CacheGeneration")
+
+
+class CacheGeneration:
+    """
+    Поколение индекса в Redis (ключ generation:<индекс>). API добавляет его
+    в ключи кеша, поэтому увеличение счётчика после загруженной пачки сразу
+    делает недействительными все закешированные ответы по индексу во всех
+    воркерах. Без REDIS_HOST счётчики не ведутся.
+    """
+
+    def __init__(self, host: str = REDIS_HOST, port: int = REDIS_PORT):
+        # Клиент подключается лениво, при первой команде
+        self.client = redis.Redis(host=host, port=port, socket_timeout=1) if host else None
+        # После ошибки Redis не трогаем до этого момента, чтобы недоступный
+        # Redis не стоил тайм-аута на каждой пачке
+        self.retry_at: float = 0.0
+        # Увеличения, выполняемые из цикла событий, и индексы, для которых
+        # за это время пришли новые пачки
+        self.pending: dict[str, asyncio.Task] = {}
+        self.dirty: set[str] = set()
+
+    def bump(self, index_name: str) -> None:
+        if self.client is None or time.monotonic() < self.retry_at:
+            return
+        try:
+            self.client.incr(f"generation:{index_name}")
+        except redis.RedisError as e:
+            self.retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+            # Кеш API доживёт до TTL, но загрузку это не останавливает
+            logger.warning(
+                f"{datetime.now()}\n\n{index_name}: поколение кеша не обновлено,"
+                f" следующая попытка через {REDIS_RETRY_INTERVAL} с: {e!r}"
+            )
+
+    def bump_soon(self, index_name: str) -> None:
+        """
+        Для асинхронного конвейера: INCR выполняется в потоке, не блокируя
+        цикл событий. Пачки, подтверждённые пока увеличение в полёте,
+        сливаются в одно следующее увеличение.
+        """
+        if self.client is None:
+            return
+        if index_name in self.pending:
+            self.dirty.add(index_name)
+            return
+        self.pending[index_name] = asyncio.create_task(self.bump_in_thread(index_name))
+
+    async def bump_in_thread(self, index_name: str) -> None:
+        try:
+            while True:
+                self.dirty.discard(index_name)
+                await asyncio.to_thread(self.bump, index_name)
+                if index_name not in self.dirty:
+                    return
+        finally:
+            del self.pending[index_name]
+
+    async def wait(self) -> None:
+        """Дожидаемся увеличений, запущенных bump_soon"""
+        while self.pending:
+            await asyncio.gather(*self.pending.values())
+
+
+# Общий счётчик процесса ETL
+generations = CacheGeneration()
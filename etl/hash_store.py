@@ -0,0 +1,86 @@
+import hashlib
+import sqlite3
+
+import orjson
+from config import ETL_HASH_STORE
+
+
+class DocumentHashStore:
+    """
+    Хэши документов, последними записанных в Elasticsearch, по индексу и id.
+    Хэш — 16 байт blake2b от документа с отсортированными ключами,
+    хранятся в одном SQLite-файле.
+    """
+
+    # Ограничение числа параметров в одном запросе SQLite
+    chunk_size: int = 500
+
+    def __init__(self, path: str = ETL_HASH_STORE):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS document_hash (
+                index_name TEXT NOT NULL,
+                id TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                PRIMARY KEY (index_name, id)
+            ) WITHOUT ROWID
+            """
+        )
+
+    @staticmethod
+    def document_hash(doc: dict) -> bytes:
+        data = orjson.dumps(doc, default=str, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def get_hashes(self, index_name: str, ids: list[str]) -> dict[str, bytes]:
+        hashes: dict[str, bytes] = {}
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start : start + self.chunk_size]
+            rows = self.conn.execute(
+                "SELECT id, hash FROM document_hash"
+                f" WHERE index_name = ? AND id IN ({','.join('?' * len(chunk))})",
+                (index_name, *chunk),
+            )
+            hashes.update(rows)
+        return hashes
+
+    def select_changed(
+        self, index_name: str, docs: list[dict]
+    ) -> tuple[list[dict], dict[str, bytes]]:
+        """
+        Оставляем документы, которые отличаются от записанных ранее,
+        и возвращаем их новые хэши для сохранения после загрузки.
+        """
+        ids = [f"{doc['id']}" for doc in docs]
+        known = self.get_hashes(index_name=index_name, ids=ids)
+        changed: list[dict] = []
+        hashes: dict[str, bytes] = {}
+        for doc_id, doc in zip(ids, docs):
+            doc_hash = self.document_hash(doc)
+            if known.get(doc_id) != doc_hash:
+                changed.append(doc)
+                hashes[doc_id] = doc_hash
+        return changed, hashes
+
+    def save(self, index_name: str, hashes: dict[str, bytes]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO document_hash (index_name, id, hash)"
+                " VALUES (?, ?, ?)",
+                ((index_name, doc_id, doc_hash) for doc_id, doc_hash in hashes.items()),
+            )
+
+    def forget(self, index_name: str, ids: list[str]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM document_hash WHERE index_name = ? AND id = ?",
+                ((index_name, doc_id) for doc_id in ids),
+            )
+
+    def clear(self, index_name: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM document_hash WHERE index_name = ?", (index_name,)
+            )
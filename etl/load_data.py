@@ -1,38 +1,103 @@
+import argparse
+import asyncio
 import logging
+import time
 from contextlib import closing
 from datetime import datetime
+from typing import Iterator, Optional
 
 import psycopg2
-from config import dsl, es_conf
+from async_pipeline import run_pipelines
+from cdc import CdcExtractor
+from config import ETL_METRICS_FILE, PG_FETCH_SIZE, dsl, es_conf
+from copy_extractor import CopyExtractor
+from daemon import EtlDaemon
+from dead_letter import DeadLetterFile
+from delete_sync import DeleteSync
 from elasticsearch_loader import ElasticSearchLoader
-from index_schemas import FILM_WORK_INDEX_BODY, GENRE_INDEX_BODY, PERSON_INDEX_BODY
+from hash_store import DocumentHashStore
+from metrics import metrics
+from partitioned import PartitionedReload, partition_queries
+from pipelines import PIPELINES, RATING_PIPELINE, film_work_sources
 from postgres_loader import PostgresLoader
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
-from query import film_work_query, genre_query, person_query
+from query import bootstrap_indexes_queries, film_work_by_ids_query
+from state import State, make_storage
+from transform import ColumnMapper
 
 from services import backoff
 
 logger = logging.getLogger("LoaderStart")
 
 
-def load_from_postgres(pg_conn: _connection, state_file: str, query: str) -> list:
-    postgres_loader = PostgresLoader(pg_conn, state_file=state_file)
-    data = postgres_loader.loader_from_postgresql(query=query)
-    print(data)
-    return data
+@backoff()
+def connect_postgres() -> _connection:
+    return psycopg2.connect(**dsl, cursor_factory=DictCursor)
 
 
-@backoff()
-def query_postgres(state_file: str, query: str) -> list:
-    with closing(psycopg2.connect(**dsl, cursor_factory=DictCursor)) as pg_conn:
+def bootstrap_indexes() -> None:
+    """
+    Создаём недостающие индексы источника, на которые опираются запросы ETL.
+    CREATE INDEX CONCURRENTLY не выполняется внутри транзакции, поэтому
+    соединение в autocommit. Ошибка одного индекса (например, нет права
+    CREATE) не мешает остальным.
+    """
+    with closing(connect_postgres()) as pg_conn:
+        pg_conn.autocommit = True
+        with pg_conn.cursor() as cursor:
+            for query in bootstrap_indexes_queries:
+                try:
+                    cursor.execute(query)
+                except psycopg2.Error as e:
+                    # Прерванный CONCURRENTLY оставляет индекс INVALID:
+                    # его нужно удалить вручную перед повтором
+                    logger.error(
+                        f"{datetime.now()}\n\nиндекс источника не создан: {e!r}\n{query}"
+                    )
+
+
+def iter_postgres(
+    state_file: str,
+    query: str,
+    batch: int,
+    watermark: Optional[dict] = None,
+    state_key: str = "key",
+) -> Iterator[list]:
+    """
+    Потоково читаем данные из PostgreSQL пачками, не держа весь результат в памяти.
+    """
+    with closing(connect_postgres()) as pg_conn:
         logger.info(
             f"{datetime.now()}\n\nустановлена связь с PostgreSQL. Начинаем загрузку данных"
         )
-        load_pq = load_from_postgres(
-            pg_conn=pg_conn, state_file=state_file, query=query
+        postgres_loader = PostgresLoader(
+            pg_conn, state_file=state_file, state_key=state_key, batch=batch
+        )
+        yield from postgres_loader.iter_batches(query=query, watermark=watermark)
+
+
+def report_throughput(index_name: str, path: str, rows: int, seconds: float) -> None:
+    """
+    Скорость извлечения рядом для обоих путей: курсора и COPY.
+    """
+    rate = rows / seconds if seconds else 0.0
+    logger.info(
+        f"{datetime.now()}\n\n{index_name}/{path}: {rows} записей за {seconds:.2f} с,"
+        f" {rate:.0f} записей/с"
+    )
+
+
+def extract_with_copy(
+    columns: list[str], query: str, batch: int, watermark: dict, on_batch
+) -> int:
+    """
+    Полное чтение через COPY: пачки документов без DictRow отдаются on_batch.
+    """
+    with closing(connect_postgres()) as pg_conn:
+        return CopyExtractor(pg_conn, columns=columns, batch=batch).extract(
+            query=query, watermark=watermark, on_batch=on_batch
         )
-    return load_pq
 
 
 def save_elastic(
@@ -41,86 +106,317 @@ def save_elastic(
     query: str,
     index_name: str,
     index_schema: dict,
+    batch: int = PG_FETCH_SIZE,
+    state_key: str = "key",
+    partial_fields: Optional[list[str]] = None,
+    hash_store: Optional[DocumentHashStore] = None,
+    copy: bool = False,
+    partitions: int = 0,
+    only_partitions: Optional[list[int]] = None,
 ) -> None:
     """
     Загружаем пачками данные в ElasticSearch, предварительно создаем индекс в бд.
+    Каждая пачка из PostgreSQL отправляется в ElasticSearch сразу после получения.
+    С copy загрузка с нуля (отметки ещё нет) читается через COPY.
+    С partitions индекс целиком перезаливается параллельно по диапазонам id,
+    only_partitions повторяет только указанные диапазоны.
     """
+    if partitions > 1 and index_name in partition_queries:
+        PartitionedReload(
+            columns=columns,
+            index_name=index_name,
+            index_schema=index_schema,
+            state_file=state_file,
+            partitions=partitions,
+            batch=batch,
+            hash_store=hash_store,
+        ).run(only=only_partitions)
+        return
     logger.info(
         f"{datetime.now()}\n\nустановлена связь с ElasticSearch. Начинаем загрузку данных"
     )
-    ElasticSearchLoader(host=es_conf, index_name=index_name).create_index(
-        index_schema=index_schema
-    )
-    data_from_postgres = query_postgres(state_file=state_file, query=query)
-    count: int = len(data_from_postgres)
-    index: int = 0
-    actions: list = []
-    while count != 0:
-        if count >= batch:
-            for row in data_from_postgres[index : index + batch]:
-                print()
-                print(dict(zip(columns, row)))
-                print()
-                import time
-                # print(time.sleep(1))
-                actions.append(dict(zip(columns, row)))
-                index += 1
-            count -= batch
-            ElasticSearchLoader(
-                host=es_conf, index_name=index_name
-            ).load_data_to_elasticsearch(actions=actions, state_file=state_file)
-            actions.clear()
-        else:
-            ElasticSearchLoader(
-                host=es_conf, index_name=index_name
-            ).load_data_to_elasticsearch(
-                actions=[
-                    dict(zip(columns, row))
-                    for row in data_from_postgres[index : index + count]
-                ],
+    es_loader = ElasticSearchLoader(
+        host=es_conf,
+        index_name=index_name,
+        state_key=state_key,
+        partial_fields=partial_fields,
+        hash_store=hash_store,
+    )
+    es_loader.create_index(index_schema=index_schema)
+    state = State(make_storage(state_file)).get_state(state_key)
+    started = time.monotonic()
+    if copy and not partial_fields and state == datetime.min:
+        rows_count = extract_with_copy(
+            columns=columns,
+            query=query,
+            batch=batch,
+            watermark=PostgresLoader.make_watermark(state),
+            on_batch=lambda docs, checkpoint: es_loader.load_data_to_elasticsearch(
+                actions=docs, state_file=state_file, checkpoint=checkpoint
+            ),
+        )
+        path = "copy"
+    else:
+        to_docs = ColumnMapper(columns)
+        rows_count = 0
+        watch = metrics.stopwatch(index_name)
+        for rows in iter_postgres(
+            state_file=state_file, query=query, batch=batch, state_key=state_key
+        ):
+            watch.lap("extract")
+            actions = to_docs(rows)
+            watch.lap("transform")
+            es_loader.load_data_to_elasticsearch(
+                actions=actions,
                 state_file=state_file,
+                checkpoint=PostgresLoader.batch_checkpoint(rows),
+            )
+            rows_count += len(rows)
+            watch.reset()
+        path = "cursor"
+    report_throughput(index_name, path, rows_count, time.monotonic() - started)
+    es_loader.refresh_index()
+    es_loader.report_counts()
+
+
+def save_elastic_fanout(
+    columns: list[str],
+    state_file: str,
+    index_name: str,
+    index_schema: dict,
+    batch: int = PG_FETCH_SIZE,
+    hash_store: Optional[DocumentHashStore] = None,
+    **kwargs,
+) -> None:
+    """
+    Двухэтапная инкрементальная загрузка фильмов. Для каждой таблицы-источника
+    выбираем id изменённых записей, переводим их в id затронутых фильмов
+    и перечитываем только эти фильмы пачками по id.
+    Отметка источника сохраняется после загрузки всех его фильмов.
+    """
+    es_loader = ElasticSearchLoader(
+        host=es_conf, index_name=index_name, hash_store=hash_store
+    )
+    es_loader.create_index(index_schema=index_schema)
+    state = State(make_storage(state_file))
+    to_docs = ColumnMapper(columns)
+    with closing(connect_postgres()) as pg_conn:
+        postgres_loader = PostgresLoader(pg_conn, state_file=state_file, batch=batch)
+        for source, changed_ids_query, film_ids_query in film_work_sources:
+            # Без своей отметки источник продолжает с общей отметки индекса
+            watermark = PostgresLoader.make_watermark(
+                state.state.get(source) or postgres_loader.get_state_key()
             )
-            count -= count
+            for ids, checkpoint in postgres_loader.iter_changed_ids(
+                query=changed_ids_query, watermark=watermark
+            ):
+                film_ids = (
+                    postgres_loader.get_related_ids(query=film_ids_query, ids=ids)
+                    if film_ids_query
+                    else ids
+                )
+                for start in range(0, len(film_ids), batch):
+                    rows = postgres_loader.get_records_by_ids(
+                        query=film_work_by_ids_query, ids=film_ids[start : start + batch]
+                    )
+                    es_loader.bulk_actions(to_docs(rows))
+                state.set_state(key=source, value=checkpoint)
+                es_loader.bump_generation()
+                logger.info(
+                    f"{datetime.now()}\n\n{source}: {len(ids)} изменённых записей, "
+                    f"перезагружено фильмов: {len(film_ids)}"
+                )
+    es_loader.refresh_index()
+    es_loader.report_counts()
+
+
+def full_reindex(
+    columns: list[str],
+    state_file: str,
+    query: str,
+    index_name: str,
+    index_schema: dict,
+    batch: int = PG_FETCH_SIZE,
+    hash_store: Optional[DocumentHashStore] = None,
+    copy: bool = False,
+) -> None:
+    """
+    Полная перезаливка индекса в новую версию без остановки чтения: API
+    продолжает читать старую версию через псевдоним, пока новая не готова.
+    Отметки в состоянии переносятся только после переключения псевдонима.
+    С copy снимок читается через COPY вместо именованного курсора.
+    """
+    alias_loader = ElasticSearchLoader(host=es_conf, index_name=index_name)
+    versioned_index = alias_loader.create_versioned_index(index_schema=index_schema)
+    es_loader = ElasticSearchLoader(host=es_conf, index_name=versioned_index)
+    checkpoint: Optional[dict] = None
+    watermark = PostgresLoader.make_watermark(datetime.min)
+    started = time.monotonic()
+    if copy:
+
+        def load_batch(docs: list[dict], batch_checkpoint: dict) -> None:
+            nonlocal checkpoint
+            es_loader.bulk_actions(docs)
+            checkpoint = batch_checkpoint
+
+        rows_count = extract_with_copy(
+            columns=columns,
+            query=query,
+            batch=batch,
+            watermark=watermark,
+            on_batch=load_batch,
+        )
+    else:
+        to_docs = ColumnMapper(columns)
+        rows_count = 0
+        for rows in iter_postgres(
+            state_file=state_file, query=query, batch=batch, watermark=watermark
+        ):
+            es_loader.bulk_actions(to_docs(rows))
+            checkpoint = PostgresLoader.batch_checkpoint(rows)
+            rows_count += len(rows)
+    report_throughput(
+        index_name, "copy" if copy else "cursor", rows_count, time.monotonic() - started
+    )
+    alias_loader.publish_index(index=versioned_index, index_schema=index_schema)
+    es_loader.report_counts()
+    if hash_store:
+        # Хэши описывали прежнюю версию индекса
+        hash_store.clear(index_name=index_name)
+    if checkpoint:
+        # Всё, что изменилось после снимка перезаливки, подхватит инкрементальная
+        # загрузка: все отметки индекса продолжаются с последней записи снимка
+        state = State(make_storage(state_file))
+        state.set_states({key: checkpoint for key in {"key", *state.state}})
+
+
+def replay_dead_letters() -> int:
+    """
+    Повторно отправляем документы из файла отклонённых, по загрузчику на индекс.
+    """
+    loaders: dict[str, ElasticSearchLoader] = {}
+
+    def send_bulk(index_name: str, body: bytes) -> set[str]:
+        if index_name not in loaders:
+            loaders[index_name] = ElasticSearchLoader(host=es_conf, index_name=index_name)
+        return loaders[index_name].send_bulk(body)
+
+    return DeadLetterFile().replay(send_bulk)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ETL PostgreSQL -> Elasticsearch")
+    parser.add_argument(
+        "--mode",
+        choices=("sync", "async"),
+        default="sync",
+        help="sync — индексы и этапы по очереди, async — все индексы одновременно,"
+        " этапы связаны очередями",
+    )
+    parser.add_argument(
+        "--fanout",
+        action="store_true",
+        help="movies: перечитывать только фильмы, затронутые изменениями"
+        " фильмов, персон и жанров",
+    )
+    parser.add_argument(
+        "--full-reindex",
+        action="store_true",
+        help="перезалить индексы в новые версии и переключить на них псевдонимы",
+    )
+    parser.add_argument(
+        "--ratings",
+        action="store_true",
+        help="только частично обновить рейтинги изменённых фильмов",
+    )
+    parser.add_argument(
+        "--cdc",
+        action="store_true",
+        help="читать изменения из логической репликации вместо опроса updated_at",
+    )
+    parser.add_argument(
+        "--delete-sync",
+        action="store_true",
+        help="удалить из индексов документы, которых больше нет в PostgreSQL",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="работать постоянно: опрашивать индексы с адаптивным интервалом"
+        " на одном соединении с PostgreSQL и одном клиенте Elasticsearch",
+    )
+    parser.add_argument(
+        "--copy",
+        action="store_true",
+        help="загрузку с нуля и полную перезаливку читать через COPY",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=0,
+        help="перезалить movies целиком в N процессах по диапазонам id",
+    )
+    parser.add_argument(
+        "--partition",
+        type=int,
+        action="append",
+        help="повторить только этот диапазон (можно указать несколько раз)",
+    )
+    parser.add_argument(
+        "--bootstrap-indexes",
+        action="store_true",
+        help="создать недостающие индексы таблиц источника (CONCURRENTLY) и выйти",
+    )
+    parser.add_argument(
+        "--replay-dead-letters",
+        action="store_true",
+        help="повторно отправить документы, отклонённые Elasticsearch",
+    )
+    args = parser.parse_args()
 
-    film_work_columns: list[str] = [
-        "id",
-        "title",
-        "description",
-        "imdb_rating",
-        "permissions",
-        "genre",
-        "director",
-        "actors_names",
-        "writers_names",
-        "actors",
-        "writers",
-        "directors",
-    ]
-    genre_columns: list[str] = ["id", "name"]
-    person_columns: list[str] = ["id", "full_name", "roles", "film_ids"]
-    batch: int = 50
+    if args.bootstrap_indexes:
+        bootstrap_indexes()
+        raise SystemExit
+    if args.replay_dead_letters:
+        replay_dead_letters()
+        raise SystemExit
+
+    hash_store = DocumentHashStore()
     """ start elastic savers """
-    save_elastic(
-        columns=film_work_columns,
-        state_file="film_work_data.txt",
-        query=film_work_query,
-        index_name="movies",
-        index_schema=FILM_WORK_INDEX_BODY,
-    )
-    save_elastic(
-        columns=genre_columns,
-        state_file="genre_data.txt",
-        query=genre_query,
-        index_name="genre",
-        index_schema=GENRE_INDEX_BODY,
-    )
-    save_elastic(
-        columns=person_columns,
-        state_file="person_data.txt",
-        query=person_query,
-        index_name="person",
-        index_schema=PERSON_INDEX_BODY,
-    )
+    if args.daemon:
+        EtlDaemon(PIPELINES, hash_store=hash_store).run()
+    elif args.cdc:
+        CdcExtractor(hash_store=hash_store).run()
+    elif args.delete_sync:
+        with closing(connect_postgres()) as pg_conn:
+            DeleteSync(
+                pg_conn,
+                loaders={
+                    pipeline["index_name"]: ElasticSearchLoader(
+                        host=es_conf,
+                        index_name=pipeline["index_name"],
+                        hash_store=hash_store,
+                    )
+                    for pipeline in PIPELINES
+                },
+            ).run()
+    elif args.ratings:
+        save_elastic(**RATING_PIPELINE, hash_store=hash_store)
+    elif args.full_reindex:
+        for pipeline in PIPELINES:
+            full_reindex(**pipeline, hash_store=hash_store, copy=args.copy)
+    elif args.mode == "async":
+        asyncio.run(run_pipelines(PIPELINES))
+    else:
+        for pipeline in PIPELINES:
+            if args.fanout and pipeline["index_name"] == "movies":
+                save_elastic_fanout(**pipeline, hash_store=hash_store)
+            else:
+                save_elastic(
+                    **pipeline,
+                    hash_store=hash_store,
+                    copy=args.copy,
+                    partitions=args.partitions,
+                    only_partitions=args.partition,
+                )
+    metrics.export(ETL_METRICS_FILE)
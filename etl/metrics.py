@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+logger = logging.getLogger("Metrics")
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    updated_at отметки: str(datetime) из курсора или текст COPY. COPY
+    отдаёт смещение как +00 и от 0 до 6 знаков долей секунды, которые
+    datetime.fromisoformat в Python 3.9 не принимает.
+    """
+    if value[-3] in "+-":
+        value += "00"
+    fmt = "%Y-%m-%d %H:%M:%S.%f%z" if "." in value else "%Y-%m-%d %H:%M:%S%z"
+    return datetime.strptime(value, fmt)
+
+
+class Stopwatch:
+    """
+    Отсечки времени этапов одной пачки: lap(stage) относит к этапу время
+    с предыдущей отсечки, reset() пропускает уже учтённое время.
+    """
+
+    def __init__(self, registry: "EtlMetrics", index_name: str):
+        self.registry = registry
+        self.index_name = index_name
+        self.started = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.registry.observe_stage(self.index_name, stage, now - self.started)
+        self.started = now
+
+    def reset(self) -> None:
+        self.started = time.perf_counter()
+
+
+class EtlMetrics:
+    """
+    Метрики ETL по индексам: время этапов extract, transform, bulk
+    и checkpoint, счётчики документов, байтов bulk, повторов и отклонений,
+    отставание индекса от updated_at источника. Отдаются в текстовом
+    формате Prometheus: файлом для textfile collector или по HTTP.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_seconds: dict[tuple[str, str], float] = defaultdict(float)
+        self.stage_calls: dict[tuple[str, str], int] = defaultdict(int)
+        self.documents: dict[tuple[str, str], int] = defaultdict(int)
+        self.bulk_bytes: dict[str, int] = defaultdict(int)
+        self.retries: dict[str, int] = defaultdict(int)
+        self.lag_seconds: dict[str, float] = {}
+
+    def stopwatch(self, index_name: str) -> Stopwatch:
+        return Stopwatch(self, index_name)
+
+    def observe_stage(self, index_name: str, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.stage_seconds[index_name, stage] += seconds
+            self.stage_calls[index_name, stage] += 1
+
+    def count_documents(self, index_name: str, result: str, count: int) -> None:
+        if count:
+            with self.lock:
+                self.documents[index_name, result] += count
+
+    def count_bulk(self, index_name: str, size: int, retries: int = 0) -> None:
+        with self.lock:
+            self.bulk_bytes[index_name] += size
+            self.retries[index_name] += retries
+
+    def observe_checkpoint(self, index_name: str, checkpoint: dict) -> None:
+        """
+        Отставание — сколько прошло от updated_at последней загруженной
+        записи до момента, когда она стала отметкой.
+        """
+        value = checkpoint.get("updated_at")
+        if not value:
+            return
+        try:
+            updated_at = parse_timestamp(value)
+        except ValueError as e:
+            logger.warning(
+                f"{datetime.now()}\n\n{index_name}: отставание не обновлено,"
+                f" не разобрана отметка {value!r}: {e}"
+            )
+            return
+        with self.lock:
+            self.lag_seconds[index_name] = (
+                datetime.now(timezone.utc) - updated_at
+            ).total_seconds()
+
+    def render(self) -> str:
+        lines: list[str] = []
+
+        def family(name: str, kind: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        with self.lock:
+            family(
+                "etl_stage_seconds_total",
+                "counter",
+                "Время работы этапа ETL",
+                [
+                    ({"index": index, "stage": stage}, round(value, 6))
+                    for (index, stage), value in sorted(self.stage_seconds.items())
+                ],
+            )
+            family(
+                "etl_stage_calls_total",
+                "counter",
+                "Число замеров этапа ETL",
+                [
+                    ({"index": index, "stage": stage}, value)
+                    for (index, stage), value in sorted(self.stage_calls.items())
+                ],
+            )
+            family(
+                "etl_documents_total",
+                "counter",
+                "Документы по результату загрузки",
+                [
+                    ({"index": index, "result": result}, value)
+                    for (index, result), value in sorted(self.documents.items())
+                ],
+            )
+            family(
+                "etl_bulk_bytes_total",
+                "counter",
+                "Объём отправленных тел bulk-запросов",
+                [({"index": index}, value) for index, value in sorted(self.bulk_bytes.items())],
+            )
+            family(
+                "etl_bulk_retries_total",
+                "counter",
+                "Элементы bulk, повторённые после 429/503",
+                [({"index": index}, value) for index, value in sorted(self.retries.items())],
+            )
+            family(
+                "etl_lag_seconds",
+                "gauge",
+                "Отставание последней отметки от updated_at источника",
+                [
+                    ({"index": index}, round(value, 3))
+                    for index, value in sorted(self.lag_seconds.items())
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Атомарная запись для textfile collector node_exporter.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", f"{len(body)}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"{datetime.now()}\n\nметрики доступны на порту {port}")
+        return server
+
+    def export(self, path: Optional[str]) -> None:
+        if path:
+            self.write_textfile(path)
+
+
+# Общий реестр процесса ETL
+metrics = EtlMetrics()
@@ -0,0 +1,250 @@
+import logging
+import multiprocessing
+import queue
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+from typing import Optional
+
+import psycopg2
+from config import ETL_PARTITIONS, ETL_QUEUE_SIZE, PG_FETCH_SIZE, dsl, es_conf
+from elasticsearch_loader import ElasticSearchLoader
+from hash_store import DocumentHashStore
+from postgres_loader import MIN_ID
+from psycopg2.extras import DictCursor
+from query import film_work_range_query
+from state import State, make_storage
+from transform import ColumnMapper
+
+from services import backoff
+
+logger = logging.getLogger("PartitionedReload")
+
+# Запросы диапазонов id для индексов, которые умеют грузиться по частям
+partition_queries: dict[str, str] = {"movies": film_work_range_query}
+
+
+def uuid_ranges(partitions: int) -> list[tuple[str, Optional[str]]]:
+    """
+    Делим пространство uuid на равные диапазоны (low, high]: случайные uuid4
+    распределены по нему равномерно. Последний диапазон открыт сверху.
+    """
+    step = 2**128 // partitions
+    bounds = [f"{uuid.UUID(int=step * number)}" for number in range(1, partitions)]
+    return list(zip([MIN_ID, *bounds], [*bounds, None]))
+
+
+@backoff()
+def connect_postgres():
+    return psycopg2.connect(**dsl, cursor_factory=DictCursor)
+
+
+def extract_partition(
+    partition: int,
+    high: Optional[str],
+    last_id: str,
+    columns: list[str],
+    query: str,
+    index_name: str,
+    batch: int,
+    bodies: multiprocessing.Queue,
+) -> None:
+    """
+    Процесс-извлекатель одного диапазона: своё соединение с PostgreSQL,
+    чтение и сборка тел bulk-запросов. Загрузку делает родительский процесс.
+    """
+    try:
+        es_loader = ElasticSearchLoader(host=es_conf, index_name=index_name)
+        to_docs = ColumnMapper(columns)
+        with closing(connect_postgres()) as pg_conn:
+            with pg_conn.cursor(name=f"partition_{partition}") as cursor:
+                cursor.itersize = batch
+                cursor.execute(query, {"last_id": last_id, "high": high})
+                while rows := cursor.fetchmany(batch):
+                    actions = to_docs(rows)
+                    bodies.put(
+                        (
+                            partition,
+                            list(es_loader.iter_bulk_bodies(actions)),
+                            len(actions),
+                            f"{rows[-1]['id']}",
+                        )
+                    )
+        bodies.put((partition, None, 0, None))
+    except Exception as e:
+        logger.error(f"{datetime.now()}\n\nдиапазон {partition} упал: {e!r}")
+        bodies.put((partition, None, -1, None))
+
+
+class PartitionedReload:
+    """
+    Полная перезаливка индекса по диапазонам id в нескольких процессах.
+    Извлечение и сборка документов идут параллельно, а bulk-запросы
+    отправляет один общий загрузчик. У каждого диапазона своя отметка
+    (последний загруженный id), поэтому упавший диапазон перезапускается
+    отдельно, без повторной загрузки остальных.
+    """
+
+    def __init__(
+        self,
+        columns: list[str],
+        index_name: str,
+        state_file: str,
+        partitions: int = ETL_PARTITIONS,
+        batch: int = PG_FETCH_SIZE,
+        hash_store: Optional[DocumentHashStore] = None,
+        **kwargs,
+    ):
+        self.columns = columns
+        self.index_name = index_name
+        self.index_schema = kwargs.get("index_schema")
+        self.query = partition_queries[index_name]
+        self.partitions = partitions
+        self.batch = batch
+        self.hash_store = hash_store
+        # Отметка инкрементальной загрузки индекса и отметки диапазонов хранятся раздельно
+        self.index_state = State(make_storage(state_file))
+        self.state = State(
+            make_storage(state_file.replace(".txt", "_partitions.txt"))
+        )
+        self.es_loader = ElasticSearchLoader(host=es_conf, index_name=index_name)
+
+    def prepare(self) -> None:
+        """
+        Новая разбивка начинается с запоминания времени старта: всё, что
+        изменится во время перезаливки, потом подхватит инкрементальная загрузка.
+        """
+        if self.state.state.get("partitions") == self.partitions:
+            return
+        with closing(connect_postgres()) as pg_conn:
+            with pg_conn.cursor() as cursor:
+                cursor.execute("SELECT now();")
+                started_at = cursor.fetchone()[0]
+        self.state.set_states(
+            {
+                **{key: None for key in self.state.state},
+                "started_at": f"{started_at}",
+                "partitions": self.partitions,
+            }
+        )
+        if self.hash_store:
+            # Хэши перестают описывать индекс, который перезаливается целиком
+            self.hash_store.clear(index_name=self.index_name)
+
+    def run(self, only: Optional[list[int]] = None) -> None:
+        self.prepare()
+        if self.index_schema:
+            self.es_loader.create_index(index_schema=self.index_schema)
+        ranges = uuid_ranges(self.partitions)
+        pending = [
+            partition
+            for partition in (only if only is not None else range(self.partitions))
+            if not (self.state.state.get(f"partition_{partition}") or {}).get("done")
+        ]
+        bodies: multiprocessing.Queue = multiprocessing.Queue(
+            maxsize=ETL_QUEUE_SIZE * max(len(pending), 1)
+        )
+        processes = {
+            partition: multiprocessing.Process(
+                target=extract_partition,
+                kwargs={
+                    "partition": partition,
+                    "high": ranges[partition][1],
+                    "last_id": (
+                        self.state.state.get(f"partition_{partition}") or {}
+                    ).get("last_id", ranges[partition][0]),
+                    "columns": self.columns,
+                    "query": self.query,
+                    "index_name": self.index_name,
+                    "batch": self.batch,
+                    "bodies": bodies,
+                },
+            )
+            for partition in pending
+        }
+        logger.info(
+            f"{datetime.now()}\n\n{self.index_name}: загрузка диапазонов {pending}"
+            f" из {self.partitions}"
+        )
+        started = time.monotonic()
+        for process in processes.values():
+            process.start()
+        running = set(processes)
+        failed: set[int] = set()
+        try:
+            while running:
+                try:
+                    self.handle(bodies.get(timeout=1), running, failed)
+                except queue.Empty:
+                    dead = [p for p in running if not processes[p].is_alive()]
+                    if not dead:
+                        continue
+                    # Процесс мог успеть положить последние пачки и сообщение
+                    # о завершении перед выходом: сначала забираем их
+                    while True:
+                        try:
+                            self.handle(bodies.get_nowait(), running, failed)
+                        except queue.Empty:
+                            break
+                    # Процесс, убитый без сообщения, считаем упавшим
+                    for partition in dead:
+                        if partition in running:
+                            running.discard(partition)
+                            failed.add(partition)
+        finally:
+            # При ошибке загрузки процессы иначе навсегда повиснут на bodies.put
+            for process in processes.values():
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+        self.es_loader.refresh_index()
+        self.es_loader.report_counts()
+        logger.info(
+            f"{datetime.now()}\n\n{self.index_name}: диапазоны загружены за"
+            f" {time.monotonic() - started:.2f} с, упали: {sorted(failed) or 'нет'}"
+        )
+        self.finish()
+
+    def handle(self, message: tuple, running: set[int], failed: set[int]) -> None:
+        partition, partition_bodies, count, last_id = message
+        if partition_bodies is None:
+            running.discard(partition)
+            if count < 0:
+                failed.add(partition)
+            else:
+                self.save(partition, done=True)
+            return
+        self.load(partition_bodies, count)
+        self.save(partition, last_id=last_id)
+
+    def load(self, bodies: list[bytes], count: int) -> None:
+        failed: set[str] = set()
+        for body in bodies:
+            failed |= self.es_loader.send_bulk(body)
+        self.es_loader.remember(sent=count, hashes={}, failed=failed)
+        self.es_loader.bump_generation()
+
+    def save(self, partition: int, last_id: Optional[str] = None, done: bool = False) -> None:
+        key = f"partition_{partition}"
+        checkpoint = self.state.state.get(key) or {}
+        if last_id:
+            checkpoint["last_id"] = last_id
+        checkpoint["done"] = done
+        self.state.set_state(key=key, value=checkpoint)
+
+    def finish(self) -> None:
+        """
+        Когда загружены все диапазоны, инкрементальная загрузка продолжает
+        со времени старта перезаливки, а разбивка сбрасывается.
+        """
+        if not all(
+            (self.state.state.get(f"partition_{partition}") or {}).get("done")
+            for partition in range(self.partitions)
+        ):
+            return
+        checkpoint = {"updated_at": self.state.state["started_at"], "last_id": MIN_ID}
+        self.index_state.set_states(
+            {key: checkpoint for key in {"key", *self.index_state.state}}
+        )
+        self.state.set_state(key="partitions", value=None)
@@ -0,0 +1,133 @@
+import logging
+import struct
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger("CDC")
+
+
+class Change(NamedTuple):
+    kind: str
+    table: str
+    row: dict
+    lsn: int = 0
+    # Старая версия строки при UPDATE, если сервер её прислал
+    old_row: Optional[dict] = None
+
+
+class PgOutputDecoder:
+    """
+    Разбор сообщений плагина pgoutput (протокол версии 1).
+    Возвращает изменения строк и коммиты, остальные сообщения пропускает.
+    """
+
+    def __init__(self):
+        # oid таблицы -> (имя таблицы, имена колонок)
+        self.relations: dict[int, tuple[str, list[str]]] = {}
+
+    def decode(self, payload: bytes) -> Optional[Change]:
+        self.payload = payload
+        self.offset = 1
+        kind = chr(payload[0])
+        if kind == "R":
+            self.read_relation()
+        elif kind == "C":
+            self.read_int(1)
+            self.read_int(8)
+            return Change(kind="commit", table="", row={}, lsn=self.read_int(8))
+        elif kind in "IUD":
+            table, columns = self.relations[self.read_int(4)]
+            row = self.read_row(columns)
+            old_row = None
+            if kind == "U" and self.offset < len(payload):
+                # Перед новой версией строки пришла старая (K или O)
+                old_row, row = row, self.read_row(columns)
+            return Change(kind=kind, table=table, row=row, old_row=old_row)
+        elif kind == "T":
+            logger.warning(f"{datetime.now()}\n\nTRUNCATE не переносится в индексы")
+        return None
+
+    def read_int(self, size: int) -> int:
+        fmt = {1: "!B", 2: "!H", 4: "!I", 8: "!Q"}[size]
+        (value,) = struct.unpack_from(fmt, self.payload, self.offset)
+        self.offset += size
+        return value
+
+    def read_string(self) -> str:
+        end = self.payload.index(b"\0", self.offset)
+        value = self.payload[self.offset : end].decode()
+        self.offset = end + 1
+        return value
+
+    def read_relation(self) -> None:
+        oid = self.read_int(4)
+        namespace = self.read_string()
+        name = self.read_string()
+        self.read_int(1)
+        columns: list[str] = []
+        for _ in range(self.read_int(2)):
+            self.read_int(1)
+            columns.append(self.read_string())
+            self.read_int(4)
+            self.read_int(4)
+        self.relations[oid] = (f"{namespace}.{name}", columns)
+
+    def read_row(self, columns: list[str]) -> dict:
+        # Маркер кортежа: N — новая версия, K — ключ, O — старая версия
+        self.read_int(1)
+        row: dict = {}
+        for column in columns[: self.read_int(2)]:
+            value_kind = chr(self.read_int(1))
+            if value_kind == "t":
+                size = self.read_int(4)
+                row[column] = self.payload[self.offset : self.offset + size].decode()
+                self.offset += size
+            elif value_kind == "n":
+                row[column] = None
+        return row
+
+
+class ChangeBatch:
+    """
+    Изменения между двумя сбросами, сгруппированные по id документов.
+    """
+
+    def __init__(self):
+        self.film_ids: set[str] = set()
+        self.person_ids: set[str] = set()
+        self.genre_ids: set[str] = set()
+        # Персоны и жанры, чьи фильмы нужно найти через таблицы связей
+        self.changed_person_ids: set[str] = set()
+        self.changed_genre_ids: set[str] = set()
+        self.deleted_film_ids: set[str] = set()
+        self.deleted_person_ids: set[str] = set()
+        self.deleted_genre_ids: set[str] = set()
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in vars(self).values())
+
+    def add(self, change: Change) -> None:
+        row = change.row
+        deleted = change.kind == "D"
+        if change.table == "content.film_work":
+            (self.deleted_film_ids if deleted else self.film_ids).add(row["id"])
+        elif change.table == "content.person":
+            if deleted:
+                self.deleted_person_ids.add(row["id"])
+            else:
+                self.person_ids.add(row["id"])
+                self.changed_person_ids.add(row["id"])
+        elif change.table == "content.genre":
+            if deleted:
+                self.deleted_genre_ids.add(row["id"])
+            else:
+                self.genre_ids.add(row["id"])
+                self.changed_genre_ids.add(row["id"])
+        elif change.table == "content.person_film_work":
+            # Связь могла переехать на другой фильм или персону: обновляем обе стороны
+            for link in filter(None, (row, change.old_row)):
+                self.film_ids.add(link["film_work_id"])
+                self.person_ids.add(link["person_id"])
+        elif change.table == "content.genre_film_work":
+            for link in filter(None, (row, change.old_row)):
+                self.film_ids.add(link["film_work_id"])
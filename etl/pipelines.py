@@ -0,0 +1,75 @@
+from typing import Optional
+
+from index_schemas import FILM_WORK_INDEX_BODY, GENRE_INDEX_BODY, PERSON_INDEX_BODY
+from query import (
+    film_work_changed_ids_query,
+    film_work_query,
+    film_work_rating_query,
+    genre_changed_ids_query,
+    genre_film_ids_query,
+    genre_query,
+    person_changed_ids_query,
+    person_film_ids_query,
+    person_query,
+)
+
+film_work_columns: list[str] = [
+    "id",
+    "title",
+    "description",
+    "imdb_rating",
+    "permissions",
+    "genre",
+    "director",
+    "actors_names",
+    "writers_names",
+    "actors",
+    "writers",
+    "directors",
+]
+genre_columns: list[str] = ["id", "name"]
+person_columns: list[str] = ["id", "full_name", "roles", "film_ids"]
+
+# Описание индексов: аргументы для save_elastic и асинхронного пайплайна
+PIPELINES: list[dict] = [
+    {
+        "columns": film_work_columns,
+        "state_file": "film_work_data.txt",
+        "query": film_work_query,
+        "index_name": "movies",
+        "index_schema": FILM_WORK_INDEX_BODY,
+    },
+    {
+        "columns": genre_columns,
+        "state_file": "genre_data.txt",
+        "query": genre_query,
+        "index_name": "genre",
+        "index_schema": GENRE_INDEX_BODY,
+    },
+    {
+        "columns": person_columns,
+        "state_file": "person_data.txt",
+        "query": person_query,
+        "index_name": "person",
+        "index_schema": PERSON_INDEX_BODY,
+    },
+]
+
+# Частичное обновление рейтингов фильмов со своей отметкой в состоянии movies
+RATING_PIPELINE: dict = {
+    "columns": ["id", "imdb_rating"],
+    "state_file": "film_work_data.txt",
+    "query": film_work_rating_query,
+    "index_name": "movies",
+    "index_schema": FILM_WORK_INDEX_BODY,
+    "state_key": "imdb_rating",
+    "partial_fields": ["imdb_rating"],
+}
+
+# Источники изменений фильмов для двухэтапной загрузки: ключ отметки в состоянии,
+# запрос изменённых id и запрос id связанных фильмов (None — это сами фильмы)
+film_work_sources: list[tuple[str, str, Optional[str]]] = [
+    ("film_work", film_work_changed_ids_query, None),
+    ("person", person_changed_ids_query, person_film_ids_query),
+    ("genre", genre_changed_ids_query, genre_film_ids_query),
+]
@@ -1,33 +1,90 @@
 from datetime import datetime
+from typing import Iterator, Optional
 
 from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor
-from state import JsonFileStorage, State
+from psycopg2.extras import DictCursor, DictRow
+from state import State, make_storage
+
+# Минимальный uuid: с него начинается выборка, если в состоянии только дата
+MIN_ID: str = "00000000-0000-0000-0000-000000000000"
 
 
 class PostgresLoader:
-    def __init__(self, pg_conn: _connection, state_file: str, state_key="key"):
+    def __init__(
+        self, pg_conn: _connection, state_file: str, state_key="key", batch: int = 100
+    ):
         self.conn = pg_conn
         self.cursor = self.conn.cursor(cursor_factory=DictCursor)
         self.key = state_key
-        self.state_key = State(JsonFileStorage(file_path=state_file)).get_state(
-            state_key
+        self.state_key = self.make_watermark(
+            State(make_storage(state_file)).get_state(state_key)
         )
-        self.batch: int = 100
-        self.data: list = []
-        self.count: int = 0
+        self.batch: int = batch
+
+    @staticmethod
+    def make_watermark(state) -> dict:
+        """
+        Приводим состояние к отметке {"updated_at", "last_id"}.
+        Старые файлы состояния хранят только дату — дополняем её минимальным id.
+        """
+        if isinstance(state, dict):
+            return state
+        return {"updated_at": f"{state}", "last_id": MIN_ID}
+
+    @staticmethod
+    def batch_checkpoint(records: list[DictRow]) -> dict:
+        """
+        Отметка последней записи пачки: выборка упорядочена по (updated_at, id),
+        поэтому это максимальная отметка во всей пачке.
+        """
+        last = records[-1]
+        return {"updated_at": f"{last['updated_at']}", "last_id": f"{last['id']}"}
 
-    def get_state_key(self):
+    def get_state_key(self) -> dict:
         """
-        Определяем какую дату будем использовать для сравнения при запросе.
+        Определяем с какой отметки (updated_at, id) продолжать выборку.
         """
         return self.state_key
 
-    def loader_from_postgresql(self, query: str) -> list:
+    def iter_batches(
+        self,
+        query: str,
+        cursor_name: str = "etl_cursor",
+        watermark: Optional[dict] = None,
+    ) -> Iterator[list[DictRow]]:
         """
-        Главный запрос на получение данных из бд.
+        Потоковое чтение главного запроса именованным курсором на стороне сервера.
+        В памяти одновременно находится не больше одной пачки из self.batch записей.
+        watermark позволяет начать не с сохранённой отметки, а с произвольной.
         """
-        self.cursor.execute(query % self.get_state_key())
-        records = self.cursor.fetchall()
-        self.conn.close()
-        return records
+        with self.conn.cursor(name=cursor_name, cursor_factory=DictCursor) as cursor:
+            cursor.itersize = self.batch
+            cursor.execute(query, watermark or self.get_state_key())
+            while records := cursor.fetchmany(self.batch):
+                yield records
+
+    def iter_changed_ids(
+        self, query: str, watermark: dict
+    ) -> Iterator[tuple[list[str], dict]]:
+        """
+        Постранично выбираем id изменённых записей одной таблицы.
+        Вместе с каждой страницей отдаём отметку её последней записи.
+        """
+        while True:
+            self.cursor.execute(query, {**watermark, "limit": self.batch})
+            records = self.cursor.fetchall()
+            if not records:
+                return
+            watermark = self.batch_checkpoint(records)
+            yield [f"{record['id']}" for record in records], watermark
+
+    def get_related_ids(self, query: str, ids: list[str]) -> list[str]:
+        """
+        Переводим id персон или жанров в id связанных с ними фильмов.
+        """
+        self.cursor.execute(query, {"ids": ids})
+        return [f"{record[0]}" for record in self.cursor.fetchall()]
+
+    def get_records_by_ids(self, query: str, ids: list[str]) -> list[DictRow]:
+        self.cursor.execute(query, {"ids": ids})
+        return self.cursor.fetchall()
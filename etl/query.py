@@ -1,8 +1,12 @@
+# Все запросы продолжают выборку с сохранённой отметки (updated_at, id):
+# id разрешает равенство дат, поэтому после падения перечитывается только
+# последняя неподтверждённая пачка.
+
 genre_query: str = """
     SELECT id, name, updated_at
     FROM content.genre
-    WHERE updated_at > '%s'
-    ORDER BY updated_at;
+    WHERE (updated_at, id) > (%(updated_at)s, %(last_id)s)
+    ORDER BY updated_at, id;
 """
 
 
@@ -15,32 +19,219 @@ person_query: str = """
     p.updated_at
     FROM content.person as p
     LEFT JOIN content.person_film_work as pfw on pfw.person_id = p.id
-    WHERE p.updated_at > '%s'
+    WHERE (p.updated_at, p.id) > (%(updated_at)s, %(last_id)s)
     group by p.id
-    ORDER BY updated_at;
+    ORDER BY updated_at, p.id;
 """
 
 
-film_work_query: str = """
+# Персоны и жанры фильма собираются в отдельных LATERAL-подзапросах, поэтому
+# объём работы растёт как сумма числа связей, а не их произведение.
+film_work_select: str = """
     select
     fw.id,
     fw.title,
     fw.description,
     fw.rating as imdb_rating,
     fw.roles as permissions,
-    array_agg(distinct g.name) as genre,
-    array_agg(distinct p.full_name) filter (WHERE pfw.role = 'director') as director,
-    array_agg(distinct p.full_name) filter (where pfw.role = 'actor') as actors_names,
-    array_agg(distinct p.full_name) filter (where pfw.role = 'writer') as writers_names,
-    array_agg(distinct jsonb_build_object('id', p.id, 'full_name', p.full_name)) filter (where pfw.role = 'actor') as actors,
-    array_agg(distinct jsonb_build_object('id', p.id, 'full_name', p.full_name)) filter (where pfw.role = 'writer') as writers,
-    array_agg(distinct jsonb_build_object('id', p.id, 'full_name', p.full_name)) filter (where pfw.role = 'director') as directors
+    g.genre,
+    p.director,
+    p.actors_names,
+    p.writers_names,
+    p.actors,
+    p.writers,
+    p.directors,
+    greatest(fw.updated_at, p.updated_at, g.updated_at) as updated_at
     from content.film_work fw
-    left join content.person_film_work as pfw on pfw.film_work_id = fw.id
-    left join content.person as p on p.id = pfw.person_id
-    left join content.genre_film_work gfw on gfw.film_work_id = fw.id
-    left join content.genre g on g.id = gfw.genre_id
-    where greatest(fw.updated_at, p.updated_at, g.updated_at) > '%s'
-    group by fw.id
-    order by greatest(fw.updated_at,  max(p.updated_at), max(g.updated_at)) asc;
+    left join lateral (
+        select
+        array_agg(distinct pe.full_name) filter (where pfw.role = 'director') as director,
+        array_agg(distinct pe.full_name) filter (where pfw.role = 'actor') as actors_names,
+        array_agg(distinct pe.full_name) filter (where pfw.role = 'writer') as writers_names,
+        array_agg(distinct jsonb_build_object('id', pe.id, 'full_name', pe.full_name)) filter (where pfw.role = 'actor') as actors,
+        array_agg(distinct jsonb_build_object('id', pe.id, 'full_name', pe.full_name)) filter (where pfw.role = 'writer') as writers,
+        array_agg(distinct jsonb_build_object('id', pe.id, 'full_name', pe.full_name)) filter (where pfw.role = 'director') as directors,
+        max(pe.updated_at) as updated_at
+        from content.person_film_work as pfw
+        join content.person as pe on pe.id = pfw.person_id
+        where pfw.film_work_id = fw.id
+    ) p on true
+    left join lateral (
+        select
+        array_agg(distinct ge.name) as genre,
+        max(ge.updated_at) as updated_at
+        from content.genre_film_work as gfw
+        join content.genre as ge on ge.id = gfw.genre_id
+        where gfw.film_work_id = fw.id
+    ) g on true
+"""
+
+
+film_work_query: str = f"""
+    {film_work_select}
+    where (greatest(fw.updated_at, p.updated_at, g.updated_at), fw.id)
+        > (%(updated_at)s, %(last_id)s)
+    order by updated_at, fw.id;
+"""
+
+
+# Частое обновление рейтингов: только id и рейтинг изменённых фильмов,
+# в Elasticsearch уходят частичные update без остальных полей документа.
+film_work_rating_query: str = """
+    SELECT id, rating as imdb_rating, updated_at
+    FROM content.film_work
+    WHERE (updated_at, id) > (%(updated_at)s, %(last_id)s)
+    ORDER BY updated_at, id;
+"""
+
+
+# Двухэтапная инкрементальная загрузка фильмов. Сначала выбираем id изменённых
+# записей каждой таблицы по индексу (updated_at, id), затем переводим id персон
+# и жанров в id фильмов через таблицы связей и перечитываем только эти фильмы.
+
+film_work_changed_ids_query: str = """
+    SELECT id, updated_at
+    FROM content.film_work
+    WHERE (updated_at, id) > (%(updated_at)s, %(last_id)s)
+    ORDER BY updated_at, id
+    LIMIT %(limit)s;
+"""
+
+
+person_changed_ids_query: str = """
+    SELECT id, updated_at
+    FROM content.person
+    WHERE (updated_at, id) > (%(updated_at)s, %(last_id)s)
+    ORDER BY updated_at, id
+    LIMIT %(limit)s;
+"""
+
+
+genre_changed_ids_query: str = """
+    SELECT id, updated_at
+    FROM content.genre
+    WHERE (updated_at, id) > (%(updated_at)s, %(last_id)s)
+    ORDER BY updated_at, id
+    LIMIT %(limit)s;
+"""
+
+
+person_film_ids_query: str = """
+    SELECT DISTINCT film_work_id
+    FROM content.person_film_work
+    WHERE person_id = ANY(%(ids)s::uuid[]);
+"""
+
+
+genre_film_ids_query: str = """
+    SELECT DISTINCT film_work_id
+    FROM content.genre_film_work
+    WHERE genre_id = ANY(%(ids)s::uuid[]);
+"""
+
+
+film_work_by_ids_query: str = f"""
+    {film_work_select}
+    where fw.id = ANY(%(ids)s::uuid[]);
+"""
+
+
+# Один диапазон id для параллельной перезаливки: внутри диапазона выборка
+# продолжается с последнего загруженного id, верхняя граница включается
+film_work_range_query: str = f"""
+    {film_work_select}
+    where fw.id > %(last_id)s and (%(high)s::uuid is null or fw.id <= %(high)s::uuid)
+    order by fw.id;
+"""
+
+
+# Перечитывание персон и жанров по id для CDC-загрузки
+person_by_ids_query: str = """
+    SELECT
+    p.id,
+    p.full_name,
+    array_agg(distinct pfw.role) as roles,
+    array_agg(distinct pfw.film_work_id)::text[] as film_ids,
+    p.updated_at
+    FROM content.person as p
+    LEFT JOIN content.person_film_work as pfw on pfw.person_id = p.id
+    WHERE p.id = ANY(%(ids)s::uuid[])
+    group by p.id;
 """
+
+
+genre_by_ids_query: str = """
+    SELECT id, name, updated_at
+    FROM content.genre
+    WHERE id = ANY(%(ids)s::uuid[]);
+"""
+
+
+# Страницы id по возрастанию для сверки удалений с Elasticsearch
+film_work_ids_query: str = """
+    SELECT id::text
+    FROM content.film_work
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(limit)s;
+"""
+
+
+person_ids_query: str = """
+    SELECT id::text
+    FROM content.person
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(limit)s;
+"""
+
+
+genre_ids_query: str = """
+    SELECT id::text
+    FROM content.genre
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(limit)s;
+"""
+
+# Перепроверка кандидатов на удаление: страницы id PostgreSQL прочитаны
+# раньше страниц индекса, и записи, добавленные за время сверки, в них нет
+film_work_existing_ids_query: str = """
+    SELECT id::text
+    FROM content.film_work
+    WHERE id = ANY(%(ids)s::uuid[]);
+"""
+
+
+person_existing_ids_query: str = """
+    SELECT id::text
+    FROM content.person
+    WHERE id = ANY(%(ids)s::uuid[]);
+"""
+
+
+genre_existing_ids_query: str = """
+    SELECT id::text
+    FROM content.genre
+    WHERE id = ANY(%(ids)s::uuid[]);
+"""
+
+# Индексы для выборок по (updated_at, id) и для переходов по таблицам связей.
+# Создаются отдельной командой (load_data.py --bootstrap-indexes), CONCURRENTLY,
+# чтобы не блокировать запись в таблицы источника.
+bootstrap_indexes_queries: list[str] = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS film_work_updated_at_id_idx"
+    " ON content.film_work (updated_at, id);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS person_updated_at_id_idx"
+    " ON content.person (updated_at, id);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS genre_updated_at_id_idx"
+    " ON content.genre (updated_at, id);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS person_film_work_film_work_id_idx"
+    " ON content.person_film_work (film_work_id);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS person_film_work_person_id_idx"
+    " ON content.person_film_work (person_id);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS genre_film_work_film_work_id_idx"
+    " ON content.genre_film_work (film_work_id);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS genre_film_work_genre_id_idx"
+    " ON content.genre_film_work (genre_id);",
+]
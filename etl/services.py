@@ -1,35 +1,99 @@
+import asyncio
 import logging
+import random
 import time
 from datetime import datetime
 from functools import wraps
 
 
-def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=3):
+def backoff_delays(start_sleep_time=0.1, factor=2, border_sleep_time=3, max_tries=10):
+    """
+    Паузы между попытками: экспоненциальный рост до border_sleep_time
+    со случайным разбросом, чтобы процессы не повторяли запросы одновременно.
+    """
+    t = start_sleep_time
+    for _ in range(max_tries - 1):
+        yield random.uniform(t / 2, t)
+        t = min(t * factor, border_sleep_time)
+
+
+def backoff(
+    start_sleep_time=0.1,
+    factor=2,
+    border_sleep_time=3,
+    max_tries=10,
+    exceptions=(Exception,),
+):
+    """
+    Повторяем вызов при исключениях из exceptions. Когда попытки исчерпаны,
+    последнее исключение пробрасывается вызывающему, а не теряется.
+    """
+
     def func_wrapper(func):
         @wraps(func)
         def inner(*args, **kwargs):
-            t = start_sleep_time
-            count: int = 0
+            delays = backoff_delays(
+                start_sleep_time, factor, border_sleep_time, max_tries
+            )
+            count: int = 1
             while True:
                 try:
                     return func(*args, **kwargs)
-                except Exception:
-                    time.sleep(t)
-                    if t >= border_sleep_time:
-                        t = border_sleep_time
-                    if t < border_sleep_time:
-                        t *= factor
+                except exceptions as e:
+                    delay = next(delays, None)
+                    if delay is None:
+                        logging.error(
+                            f"{datetime.now()}\n\n{func.__qualname__}: исчерпано "
+                            f"максимальное количество попыток={count}: {e!r}\n"
+                        )
+                        raise
                     logging.error(
-                        f"{datetime.now()}\n\n{Exception} \n\n Попытка подключение №{count}"
+                        f"{datetime.now()}\n\n{func.__qualname__}: {e!r}"
+                        f" \n\n Попытка №{count}, повтор через {delay:.2f} с"
                     )
+                    time.sleep(delay)
                     count += 1
-                    continue
-                finally:
-                    if count == 10:
-                        logging.info(
-                            f"{datetime.now()}\n\nИсчерпано максимальное количество подключений={count}.\n"
+
+        return inner
+
+    return func_wrapper
+
+
+def async_backoff(
+    start_sleep_time=0.1,
+    factor=2,
+    border_sleep_time=3,
+    max_tries=10,
+    exceptions=(Exception,),
+):
+    """
+    То же, что backoff, но для корутин: ожидание не блокирует цикл событий.
+    """
+
+    def func_wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            delays = backoff_delays(
+                start_sleep_time, factor, border_sleep_time, max_tries
+            )
+            count: int = 1
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except exceptions as e:
+                    delay = next(delays, None)
+                    if delay is None:
+                        logging.error(
+                            f"{datetime.now()}\n\n{func.__qualname__}: исчерпано "
+                            f"максимальное количество попыток={count}: {e!r}\n"
                         )
-                        break
+                        raise
+                    logging.error(
+                        f"{datetime.now()}\n\n{func.__qualname__}: {e!r}"
+                        f" \n\n Попытка №{count}, повтор через {delay:.2f} с"
+                    )
+                    await asyncio.sleep(delay)
+                    count += 1
 
         return inner
 
@@ -2,8 +2,12 @@ import abc
 import datetime
 import json
 import logging
+import os
+import sqlite3
 from typing import Any, Optional
 
+from config import ETL_STATE_BACKEND, ETL_STATE_DB
+
 
 class BaseStorage:
     @abc.abstractmethod
@@ -16,6 +20,10 @@ class BaseStorage:
         """Загрузить состояние локально из постоянного хранилища"""
         pass
 
+    def save_items(self, state: dict, items: dict) -> None:
+        """Сохранить изменённые ключи одной операцией; по умолчанию всё состояние"""
+        self.save_state(state)
+
 
 class JsonFileStorage(BaseStorage):
     def __init__(self, file_path: Optional[str] = None):
@@ -25,8 +33,14 @@ class JsonFileStorage(BaseStorage):
         if not self.file_path:
             return
 
-        with open(self.file_path, "w") as f:
+        # Пишем во временный файл и атомарно подменяем: при падении остаётся
+        # либо старое, либо новое состояние, но не обрезанный файл
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w") as f:
             json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
 
     def retrieve_state(self) -> Optional[dict]:
         if self.file_path:
@@ -40,6 +54,79 @@ class JsonFileStorage(BaseStorage):
             self.save_state({})
 
 
+class SQLiteStorage(BaseStorage):
+    """
+    Состояния всех конвейеров в одном SQLite-файле в режиме WAL. Ключи
+    состояния одного файла конвейера хранятся под его именем (namespace),
+    каждый ключ — отдельная строка, поэтому отметка пачки обновляет одну
+    строку, а не переписывает весь файл. Несколько ключей сохраняются
+    в одной транзакции.
+    """
+
+    connections: dict[str, sqlite3.Connection] = {}
+
+    def __init__(self, namespace: str, path: str = ETL_STATE_DB):
+        self.namespace = namespace
+        self.conn = self.connect(path)
+
+    @classmethod
+    def connect(cls, path: str) -> sqlite3.Connection:
+        if path not in cls.connections:
+            conn = sqlite3.connect(path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # В WAL режим NORMAL не портит базу при падении процесса
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS etl_state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+                """
+            )
+            cls.connections[path] = conn
+        return cls.connections[path]
+
+    def save_state(self, state: dict) -> None:
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM etl_state WHERE namespace = ?", (self.namespace,)
+            )
+            self.write(state)
+
+    def save_items(self, state: dict, items: dict) -> None:
+        with self.conn:
+            self.write(items)
+
+    def write(self, items: dict) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO etl_state (namespace, key, value) VALUES (?, ?, ?)",
+            ((self.namespace, key, json.dumps(value)) for key, value in items.items()),
+        )
+
+    def retrieve_state(self) -> dict:
+        rows = self.conn.execute(
+            "SELECT key, value FROM etl_state WHERE namespace = ?", (self.namespace,)
+        ).fetchall()
+        if not rows and os.path.exists(self.namespace):
+            # Переносим состояние из прежнего JSON-файла конвейера
+            state = JsonFileStorage(file_path=self.namespace).retrieve_state() or {}
+            self.save_state(state)
+            return state
+        return {key: json.loads(value) for key, value in rows}
+
+
+def make_storage(state_file: str) -> BaseStorage:
+    """
+    Хранилище состояния конвейера по настройке ETL_STATE_BACKEND.
+    """
+    if ETL_STATE_BACKEND == "json":
+        return JsonFileStorage(file_path=state_file)
+    return SQLiteStorage(namespace=state_file)
+
+
 class State:
     def __init__(self, storage: BaseStorage):
         self.storage = storage
@@ -50,8 +137,12 @@ class State:
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа"""
-        self.state[key] = value
-        self.storage.save_state(self.state)
+        self.set_states({key: value})
+
+    def set_states(self, values: dict) -> None:
+        """Установить несколько ключей одной транзакцией хранилища"""
+        self.state.update(values)
+        self.storage.save_items(self.state, values)
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу"""
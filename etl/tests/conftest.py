@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Модули ETL импортируются плоско, как при запуске из каталога etl
+sys.path.insert(0, f"{Path(__file__).resolve().parent.parent}")
+
+# config пишет журнал в logs/, а файлы состояния по умолчанию создаются
+# в текущем каталоге: тесты работают во временном
+os.chdir(tempfile.mkdtemp(prefix="etl-tests-"))
+Path("logs").mkdir()
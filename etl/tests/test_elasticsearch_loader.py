@@ -0,0 +1,147 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("elasticsearch")
+pytest.importorskip("orjson")
+pytest.importorskip("redis")
+
+from dead_letter import DeadLetterFile  # noqa: E402
+from elasticsearch_loader import ElasticSearchLoader  # noqa: E402
+from hash_store import DocumentHashStore  # noqa: E402
+
+INDEX = "movies"
+DOC = {"id": "b5bd1d4a-3b5c-4a1e-9b3e-6d8c2f0a1e01", "title": "Star Wars"}
+
+
+class FakeIndices:
+    def __init__(self):
+        self.names: set[str] = set()
+        self.aliases: dict[str, set[str]] = {}
+
+    def exists(self, index: str) -> bool:
+        return index in self.names
+
+    def create(self, index: str, ignore=None, body=None) -> dict:
+        self.names.add(index)
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index: str, ignore=None) -> None:
+        self.names.discard(index)
+
+    def get(self, index: str) -> dict:
+        prefix = index.rstrip("*")
+        return {name: {} for name in sorted(self.names) if name.startswith(prefix)}
+
+    def get_alias(self, name: str, ignore=None) -> dict:
+        targets = {index: {} for index in self.aliases.get(name, ())}
+        return targets or {"error": "alias missing", "status": 404}
+
+    def update_aliases(self, body: dict) -> None:
+        for action in body["actions"]:
+            for kind, params in action.items():
+                targets = self.aliases.setdefault(params.get("alias"), set())
+                if kind == "add":
+                    targets.add(params["index"])
+                elif kind == "remove":
+                    targets.discard(params["index"])
+
+
+class FakeClient:
+    def __init__(self):
+        self.indices = FakeIndices()
+
+
+@pytest.fixture
+def loader(tmp_path) -> ElasticSearchLoader:
+    return ElasticSearchLoader(
+        host=[],
+        index_name=INDEX,
+        hash_store=DocumentHashStore(path=f"{tmp_path / 'hashes.db'}"),
+        client=FakeClient(),
+    )
+
+
+def remember_loaded(loader: ElasticSearchLoader) -> None:
+    changed, hashes = loader.select_changed([DOC])
+    assert changed == [DOC]
+    loader.remember(sent=1, hashes=hashes, failed=set())
+
+
+def test_unchanged_document_is_skipped(loader):
+    loader.create_index(index_schema={})
+    remember_loaded(loader)
+    assert loader.select_changed([DOC]) == ([], {})
+
+
+def test_existing_index_keeps_hashes(loader):
+    loader.create_index(index_schema={})
+    remember_loaded(loader)
+    loader.create_index(index_schema={})
+    assert loader.select_changed([DOC])[0] == []
+
+
+def test_recreated_index_forgets_hashes(loader):
+    loader.create_index(index_schema={})
+    remember_loaded(loader)
+    # Индекс удалён или потерян, состояние загрузки сброшено
+    loader.client.indices.delete(index=INDEX)
+    loader.create_index(index_schema={})
+    assert loader.select_changed([DOC])[0] == [DOC]
+
+
+def test_publish_keeps_previous_alias_target(loader):
+    indices = loader.client.indices
+    indices.names |= {f"{INDEX}_v1", f"{INDEX}_v2"}
+    indices.aliases[INDEX] = {f"{INDEX}_v2"}
+    # Недостроенная версия после неудачной перезаливки
+    indices.names.add(f"{INDEX}_v3")
+    indices.names.add(f"{INDEX}_v4")
+
+    previous = loader.switch_alias(index=f"{INDEX}_v4")
+    loader.delete_old_versions(index=f"{INDEX}_v4", previous=previous)
+
+    assert previous == f"{INDEX}_v2"
+    assert indices.aliases[INDEX] == {f"{INDEX}_v4"}
+    assert indices.names == {f"{INDEX}_v2", f"{INDEX}_v4"}
+
+
+def test_partial_update_of_missing_document_is_skipped(tmp_path):
+    dead_letters = DeadLetterFile(path=f"{tmp_path / 'dead_letters.ndjson'}")
+    loader = ElasticSearchLoader(
+        host=[],
+        index_name=INDEX,
+        partial_fields=["imdb_rating"],
+        client=FakeClient(),
+        dead_letters=dead_letters,
+    )
+    body = b"".join(
+        b"\n".join(loader.make_action({"id": doc_id, "imdb_rating": 7.5})) + b"\n"
+        for doc_id in ("missing", "broken")
+    )
+    response = {
+        "errors": True,
+        "items": [
+            {
+                "update": {
+                    "_id": "missing",
+                    "status": 404,
+                    "error": {"type": "document_missing_exception"},
+                }
+            },
+            {
+                "update": {
+                    "_id": "broken",
+                    "status": 400,
+                    "error": {"type": "mapper_parsing_exception"},
+                }
+            },
+        ],
+    }
+
+    retry, failed = loader.check_bulk_response(body=body, response=response)
+
+    assert retry == b""
+    assert failed == {"missing", "broken"}
+    assert (loader.skipped, loader.rejected) == (1, 1)
+    records = list(dead_letters.iter_records(dead_letters.path))
+    assert [record["action"]["update"]["_id"] for record in records] == ["broken"]
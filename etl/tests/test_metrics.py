@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from metrics import EtlMetrics, parse_timestamp
+
+EXPECTED = datetime(2021, 6, 16, 20, 14, 9, 120000, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2021-06-16 20:14:09.12+00",
+        "2021-06-16 20:14:09.120000+00:00",
+        "2021-06-16 23:14:09.12+03",
+        "2021-06-16 22:44:09.1200+02:30",
+    ],
+)
+def test_parse_timestamp(value):
+    assert parse_timestamp(value) == EXPECTED
+
+
+def test_parse_timestamp_without_fraction():
+    assert parse_timestamp("2021-06-16 20:14:09+00") == EXPECTED.replace(microsecond=0)
+
+
+def test_observe_checkpoint_from_copy():
+    registry = EtlMetrics()
+    updated_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+    value = updated_at.strftime("%Y-%m-%d %H:%M:%S.%f")[:-4] + "+00"
+    registry.observe_checkpoint("movies", {"updated_at": value, "last_id": "x"})
+    assert 299 < registry.lag_seconds["movies"] < 302
+
+
+def test_observe_checkpoint_logs_bad_value(caplog):
+    registry = EtlMetrics()
+    registry.observe_checkpoint("movies", {"updated_at": "infinity", "last_id": "x"})
+    assert "movies" not in registry.lag_seconds
+    assert "infinity" in caplog.text
@@ -0,0 +1,138 @@
+import struct
+from typing import Optional
+
+import pytest
+from pgoutput import Change, ChangeBatch, PgOutputDecoder
+
+FILM_WORK_OID = 16384
+PERSON_FILM_WORK_OID = 16390
+
+
+def relation(oid: int, namespace: str, name: str, columns: list[str]) -> bytes:
+    payload = b"R" + struct.pack("!I", oid)
+    payload += namespace.encode() + b"\0" + name.encode() + b"\0"
+    payload += b"f" + struct.pack("!H", len(columns))
+    for column in columns:
+        payload += b"\0" + column.encode() + b"\0" + struct.pack("!Ii", 25, -1)
+    return payload
+
+
+def tuple_data(marker: bytes, values: list[Optional[str]]) -> bytes:
+    payload = marker + struct.pack("!H", len(values))
+    for value in values:
+        if value is None:
+            payload += b"n"
+        else:
+            payload += b"t" + struct.pack("!I", len(value.encode())) + value.encode()
+    return payload
+
+
+def insert(oid: int, values: list[Optional[str]]) -> bytes:
+    return b"I" + struct.pack("!I", oid) + tuple_data(b"N", values)
+
+
+def update(
+    oid: int, values: list[Optional[str]], old_values: Optional[list] = None
+) -> bytes:
+    payload = b"U" + struct.pack("!I", oid)
+    if old_values is not None:
+        payload += tuple_data(b"O", old_values)
+    return payload + tuple_data(b"N", values)
+
+
+def delete(oid: int, values: list[Optional[str]]) -> bytes:
+    return b"D" + struct.pack("!I", oid) + tuple_data(b"K", values)
+
+
+def commit(end_lsn: int) -> bytes:
+    return b"C" + struct.pack("!BQQQ", 0, end_lsn - 8, end_lsn, 0)
+
+
+@pytest.fixture
+def decoder() -> PgOutputDecoder:
+    decoder = PgOutputDecoder()
+    assert decoder.decode(
+        relation(FILM_WORK_OID, "content", "film_work", ["id", "title", "rating"])
+    ) is None
+    assert decoder.decode(
+        relation(
+            PERSON_FILM_WORK_OID,
+            "content",
+            "person_film_work",
+            ["id", "film_work_id", "person_id"],
+        )
+    ) is None
+    return decoder
+
+
+def test_relation_is_remembered(decoder):
+    assert decoder.relations[FILM_WORK_OID] == (
+        "content.film_work",
+        ["id", "title", "rating"],
+    )
+
+
+def test_insert(decoder):
+    change = decoder.decode(insert(FILM_WORK_OID, ["f1", "Title", None]))
+    assert change == Change(
+        kind="I",
+        table="content.film_work",
+        row={"id": "f1", "title": "Title", "rating": None},
+    )
+
+
+def test_update_without_old_row(decoder):
+    change = decoder.decode(update(FILM_WORK_OID, ["f1", "Новое название", "8.1"]))
+    assert change.kind == "U"
+    assert change.row == {"id": "f1", "title": "Новое название", "rating": "8.1"}
+    assert change.old_row is None
+
+
+def test_update_with_old_row(decoder):
+    change = decoder.decode(
+        update(PERSON_FILM_WORK_OID, ["l1", "f2", "p1"], old_values=["l1", "f1", "p1"])
+    )
+    assert change.old_row == {"id": "l1", "film_work_id": "f1", "person_id": "p1"}
+    assert change.row == {"id": "l1", "film_work_id": "f2", "person_id": "p1"}
+
+
+def test_delete(decoder):
+    change = decoder.decode(delete(FILM_WORK_OID, ["f1"]))
+    assert change.kind == "D"
+    assert change.table == "content.film_work"
+    assert change.row == {"id": "f1"}
+
+
+def test_commit_returns_end_lsn(decoder):
+    change = decoder.decode(commit(end_lsn=0x16B3748))
+    assert change.kind == "commit"
+    assert change.lsn == 0x16B3748
+
+
+def test_skipped_messages(decoder):
+    # BEGIN и TRUNCATE в индексы не переносятся
+    assert decoder.decode(b"B" + struct.pack("!QQI", 1, 0, 7)) is None
+    assert decoder.decode(b"T" + struct.pack("!IBI", 1, 0, FILM_WORK_OID)) is None
+
+
+def test_batch_groups_changes(decoder):
+    batch = ChangeBatch()
+    for payload in (
+        insert(FILM_WORK_OID, ["f1", "Title", None]),
+        delete(FILM_WORK_OID, ["f2"]),
+        update(PERSON_FILM_WORK_OID, ["l1", "f4", "p1"], old_values=["l1", "f3", "p2"]),
+    ):
+        batch.add(decoder.decode(payload))
+    assert batch.film_ids == {"f1", "f3", "f4"}
+    assert batch.deleted_film_ids == {"f2"}
+    assert batch.person_ids == {"p1", "p2"}
+    assert len(batch) == 6
+
+
+def test_batch_person_change_needs_film_lookup():
+    batch = ChangeBatch()
+    batch.add(Change(kind="U", table="content.person", row={"id": "p1"}))
+    batch.add(Change(kind="D", table="content.person", row={"id": "p2"}))
+    assert batch.person_ids == {"p1"}
+    assert batch.changed_person_ids == {"p1"}
+    assert batch.deleted_person_ids == {"p2"}
@@ -0,0 +1,64 @@
+from operator import itemgetter
+from typing import Callable, Sequence
+
+import orjson
+
+
+class ColumnMapper:
+    """
+    Преобразование строк выборки в документы индекса: значения по порядку
+    колонок (row[0], row[1], ...) или, с by_name, по их именам (row["id"], ...).
+    """
+
+    def __init__(self, columns: Sequence[str], by_name: bool = False):
+        self.columns = tuple(columns)
+        columns = self.columns
+        if by_name:
+            # itemgetter одной колонки возвращает значение, а не кортеж
+            values: Callable = (
+                itemgetter(*columns) if len(columns) > 1 else lambda row: (row[columns[0]],)
+            )
+            self.map_row: Callable[[Sequence], dict] = lambda row: dict(
+                zip(columns, values(row))
+            )
+        else:
+            self.map_row = lambda row: dict(zip(columns, row))
+
+    def __call__(self, rows: Sequence[Sequence]) -> list[dict]:
+        map_row = self.map_row
+        return [map_row(row) for row in rows]
+
+
+class BulkBuffer:
+    """
+    Переиспользуемый буфер тела bulk-запроса. Пары action/документ
+    сериализуются orjson сразу в байты и дописываются в один bytearray,
+    без промежуточных списков строк и b"\\n".join.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.count: int = 0
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def append(self, action: bytes, doc: bytes) -> None:
+        buffer = self.buffer
+        buffer += action
+        buffer += b"\n"
+        buffer += doc
+        buffer += b"\n"
+        self.count += 1
+
+    def clear(self) -> None:
+        self.buffer.clear()
+        self.count = 0
+
+
+def dumps(value) -> bytes:
+    """
+    orjson сам сериализует datetime и uuid, Decimal приводим к строке,
+    как раньше делал json.dumps(default=str).
+    """
+    return orjson.dumps(value, default=str)
@@ -1,11 +1,10 @@
 from http import HTTPStatus
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
 from api.v1.utils import FilmQueryParams
-from models.film import DetailResponseFilm, ESFilm, FilmPagination
-from models.person import FilmPerson
+from models.film import DetailResponseFilm, FilmPagination
 from services.film import FilmService, get_film_service
 from services.jwt_service.jwt_dependency import JWTBearer
 
@@ -26,10 +25,8 @@ async def search_film_list(
     film_service: FilmService = Depends(get_film_service),
     page: int = 1,
     page_size: int = 10,
-) -> FilmPagination:
-    print(permissions)
-
-    films: Optional[dict] = await film_service.get_all_films(
+) -> Response:
+    films: Optional[bytes] = await film_service.get_all_films(
         permissions=permissions,
         sorting=params.sort,
         page=page,
@@ -40,7 +37,8 @@ async def search_film_list(
     if not films:
         # Если жанры не найдены, отдаём 404 статус
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="films not found")
-    return FilmPagination(**films)
+    # Тело ответа уже собрано и проверено по FilmPagination при записи в кеш
+    return Response(content=films, media_type="application/json")
 
 
 @router.get(
@@ -54,31 +52,9 @@ async def search_film_list(
 async def film_details(
     film_id: str, film_service: FilmService = Depends(get_film_service),
     permissions = Depends(JWTBearer())
-) -> DetailResponseFilm:
-    print(permissions)
-
-    film = await film_service.get_by_id(target_id=film_id, schema=ESFilm)
+) -> Response:
+    film: Optional[bytes] = await film_service.get_film(film_id=film_id)
     if not film:
         # Если фильм не найден, отдаём 404 статус
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="film not found")
-    actors_list: list[FilmPerson] = [
-        FilmPerson(uuid=actor.get("id"), full_name=actor.get("name"))
-        for actor in film.actors
-    ]
-    writers_list: list[FilmPerson] = [
-        FilmPerson(uuid=actor.get("id"), full_name=actor.get("name"))
-        for actor in film.writers
-    ]
-    directors_list: list[FilmPerson] = [
-        FilmPerson(uuid=director.get("id"), full_name=director.get("name"))
-        for director in film.directors
-    ]
-    return DetailResponseFilm(
-        uuid=film.id,
-        title=film.title,
-        imdb_rating=film.imdb_rating,
-        description=film.description,
-        actors=actors_list,
-        writers=writers_list,
-        directors=directors_list,
-    )
+    return Response(content=film, media_type="application/json")
@@ -1,9 +1,9 @@
 from http import HTTPStatus
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
-from models.genre import DetailResponseGenre, ElasticGenre, GenrePagination
+from models.genre import DetailResponseGenre, GenrePagination
 from services.genre import GenreService, get_genre_service
 
 router = APIRouter()
@@ -21,14 +21,14 @@ async def genres_list(
     genre_service: GenreService = Depends(get_genre_service),
     page: int = 1,
     page_size: int = 10,
-) -> GenrePagination:
-    genres: Optional[dict] = await genre_service.get_genres_list(
+) -> Response:
+    genres: Optional[bytes] = await genre_service.get_genres_list(
         page=page, page_size=page_size
     )
     if not genres:
         # Если жанры не найдены, отдаём 404 статус
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="genres not found")
-    return GenrePagination(**genres)
+    return Response(content=genres, media_type="application/json")
 
 
 @router.get(
@@ -41,9 +41,9 @@ async def genres_list(
 )
 async def genre_details(
     genre_id: str, genre_service: GenreService = Depends(get_genre_service)
-) -> DetailResponseGenre:
-    genre = await genre_service.get_by_id(target_id=genre_id, schema=ElasticGenre)
+) -> Response:
+    genre: Optional[bytes] = await genre_service.get_genre(genre_id=genre_id)
     if not genre:
         # Если жанр не найден, отдаём 404 статус
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="genre not found")
-    return DetailResponseGenre(uuid=genre.id, name=genre.name)
+    return Response(content=genre, media_type="application/json")
@@ -1,7 +1,7 @@
 from http import HTTPStatus
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
 from api.v1.utils import PersonSearchParam
 from models.film import FilmPagination
@@ -24,8 +24,8 @@ async def person_search(
     person_service: PersonService = Depends(get_person_service),
     page: int = 1,
     page_size: int = 10,
-) -> PersonPagination:
-    persons: Optional[dict] = await person_service.search_person(
+) -> Response:
+    persons: Optional[bytes] = await person_service.search_person(
         query=params.query, page=page, page_size=page_size
     )
     if not persons:
@@ -33,7 +33,7 @@ async def person_search(
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail="persons not found"
         )
-    return PersonPagination(**persons)
+    return Response(content=persons, media_type="application/json")
 
 
 @router.get(
@@ -46,14 +46,11 @@ async def person_search(
 )
 async def person_details(
     person_id: str, person_service: PersonService = Depends(get_person_service)
-) -> DetailResponsePerson:
-    person = await person_service.get_person(person_id=person_id)
-    return DetailResponsePerson(
-        uuid=person.id,
-        full_name=person.full_name,
-        role=person.roles[0],
-        film_ids=person.film_ids,
+) -> Response:
+    person: Optional[bytes] = await person_service.get_person_details(
+        person_id=person_id
     )
+    return Response(content=person, media_type="application/json")
 
 
 @router.get(
@@ -70,14 +67,13 @@ async def get_person_films(
     person_service: PersonService = Depends(get_person_service),
     page: int = 1,
     page_size: int = 10,
-) -> FilmPagination:
-    person = await person_service.get_person(person_id=person_id)
-    person_films = await person_service.get_person_films(
-        film_ids=person.film_ids, page=page, page_size=page_size, person_id=person_id
+) -> Response:
+    person_films: Optional[bytes] = await person_service.get_person_films(
+        page=page, page_size=page_size, person_id=person_id
     )
     if not person_films:
         # Если персона не найдена, отдаём 404 статус
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail="person's films not found"
         )
-    return FilmPagination(**person_films)
+    return Response(content=person_films, media_type="application/json")
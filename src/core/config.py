@@ -30,7 +30,29 @@ REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
 ELASTIC_HOST: str = os.getenv("ELASTIC_HOST", "127.0.0.1")
 ELASTIC_PORT: int = int(os.getenv("ELASTIC_PORT", 9200))
 
-CACHE_EXPIRE_IN_SECONDS: int = 60 * 5  # 5 минут
+# Ответы сбрасываются по поколению индекса, которое увеличивает ETL,
+# поэтому время жизни кеша лишь ограничивает занятую им память Redis.
+# Запись свежая CACHE_EXPIRE_IN_SECONDS, уменьшенные на случайную долю
+# до CACHE_TTL_JITTER, затем ещё CACHE_STALE_IN_SECONDS отдаётся устаревшей,
+# пока обновляется в фоне. CACHE_EARLY_REFRESH_BETA > 1 обновляет записи
+# раньше срока чаще, 0 — только после него
+CACHE_EXPIRE_IN_SECONDS: int = int(os.getenv("CACHE_EXPIRE_IN_SECONDS", 60 * 60))  # 1 час
+CACHE_STALE_IN_SECONDS: int = int(os.getenv("CACHE_STALE_IN_SECONDS", 60 * 10))
+CACHE_TTL_JITTER: float = float(os.getenv("CACHE_TTL_JITTER", 0.1))
+CACHE_EARLY_REFRESH_BETA: float = float(os.getenv("CACHE_EARLY_REFRESH_BETA", 1))
+# Сколько секунд воркер не перечитывает из Redis поколение индекса
+CACHE_GENERATION_MEMO: float = float(os.getenv("CACHE_GENERATION_MEMO", 1))
+
+# Промах кеша загружает один воркер под блокировкой в Redis на CACHE_LOCK_TIMEOUT
+# секунд, остальные ждут значение в кеше, проверяя его раз в CACHE_LOCK_POLL;
+# 0 выключает блокировку между воркерами
+CACHE_LOCK_TIMEOUT: float = float(os.getenv("CACHE_LOCK_TIMEOUT", 2))
+CACHE_LOCK_POLL: float = float(os.getenv("CACHE_LOCK_POLL", 0.05))
+
+# Кеш в памяти воркера перед Redis: число записей, объём значений и время жизни
+CACHE_MEMORY_MAX_ITEMS: int = int(os.getenv("CACHE_MEMORY_MAX_ITEMS", 10000))
+CACHE_MEMORY_MAX_BYTES: int = int(os.getenv("CACHE_MEMORY_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_MEMORY_TTL: int = int(os.getenv("CACHE_MEMORY_TTL", 60))
 
 # Корень проекта
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -1,6 +1,9 @@
 from abc import ABC, abstractmethod
 from typing import Optional, Union
 
+# Ключи поколений индексов, которые увеличивает ETL
+GENERATION_PREFIX: str = "generation:"
+
 
 class AbstractCache(ABC):
     def __init__(self, cache_instance):
@@ -14,10 +17,24 @@ class AbstractCache(ABC):
     async def set(self, key: str, value: Union[bytes, str], expire: int):
         pass
 
+    @abstractmethod
+    async def acquire_lock(self, key: str, token: str, timeout: float) -> bool:
+        """Ставим ключ key со значением token, только если его нет, на timeout секунд"""
+        pass
+
+    @abstractmethod
+    async def release_lock(self, key: str, token: str):
+        """Снимаем ключ key, только если он всё ещё наш (равен token)"""
+        pass
+
     @abstractmethod
     async def close(self):
         pass
 
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов по уровням кеша"""
+        return {}
+
 
 cache: Optional[AbstractCache] = None
 
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from typing import Callable, NoReturn, Optional, Union
+
+from db.cache import GENERATION_PREFIX, AbstractCache
+
+
+class CacheInMemory(AbstractCache):
+    """
+    Кеш в памяти воркера перед общим кешем (Redis). Горячие ключи отдаются
+    без сетевого запроса. Размер ограничен числом записей и суммарным
+    объёмом значений, при переполнении вытесняются давно не читанные записи.
+    Согласованность с другими воркерами держится на поколении индекса
+    в ключах: после загрузки ETL старые записи просто перестают читаться
+    и уходят по TTL или вытеснением. Сами поколения здесь не хранятся.
+    soft_expiry достаёт из значения его мягкий срок (unix-время): копия
+    в памяти живёт не дольше него, поэтому после обновления записи другим
+    воркером здесь не отдаётся прежнее значение, а устаревшие записи
+    каждый раз читаются из Redis.
+    """
+
+    def __init__(
+        self,
+        cache_instance: AbstractCache,
+        max_items: int,
+        max_bytes: int,
+        ttl: int,
+        soft_expiry: Optional[Callable[[Union[bytes, str]], float]] = None,
+    ):
+        super().__init__(cache_instance)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.soft_expiry = soft_expiry
+        # ключ -> (значение, момент истечения); порядок — от давно читанных
+        self.entries: OrderedDict[str, tuple[Union[bytes, str], float]] = OrderedDict()
+        self.size: int = 0
+        self.hits: dict[str, int] = {"memory": 0, "redis": 0}
+        self.misses: dict[str, int] = {"memory": 0, "redis": 0}
+
+    async def get(self, key: str) -> Optional[Union[bytes, str]]:
+        if key.startswith(GENERATION_PREFIX):
+            return await self.cache.get(key=key)
+        entry = self.entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            self.entries.move_to_end(key)
+            self.hits["memory"] += 1
+            return entry[0]
+        if entry:
+            self._evict(key)
+        self.misses["memory"] += 1
+        value = await self.cache.get(key=key)
+        if value is None:
+            self.misses["redis"] += 1
+            return None
+        self.hits["redis"] += 1
+        # Оставшийся TTL в Redis неизвестен, но мягкий срок не дальше него
+        self._put(key, value, self.ttl)
+        return value
+
+    async def set(self, key: str, value: Union[bytes, str], expire: int):
+        await self.cache.set(key=key, value=value, expire=expire)
+        self._put(key, value, min(expire, self.ttl))
+
+    async def acquire_lock(self, key: str, token: str, timeout: float) -> bool:
+        # Блокировки нужны между воркерами, поэтому только в общем кеше
+        return await self.cache.acquire_lock(key=key, token=token, timeout=timeout)
+
+    async def release_lock(self, key: str, token: str):
+        await self.cache.release_lock(key=key, token=token)
+
+    async def close(self) -> NoReturn:
+        self.entries.clear()
+        self.size = 0
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        return {
+            tier: {"hits": self.hits[tier], "misses": self.misses[tier]}
+            for tier in ("memory", "redis")
+        } | {"memory_items": len(self.entries), "memory_bytes": self.size}
+
+    def _put(self, key: str, value: Union[bytes, str], ttl: float) -> None:
+        if key in self.entries:
+            self._evict(key)
+        if self.soft_expiry:
+            ttl = min(ttl, self.soft_expiry(value) - time.time())
+        if len(value) > self.max_bytes or ttl <= 0:
+            return
+        self.entries[key] = (value, time.monotonic() + ttl)
+        self.size += len(value)
+        while len(self.entries) > self.max_items or self.size > self.max_bytes:
+            self._evict(next(iter(self.entries)))
+
+    def _evict(self, key: str) -> None:
+        value, _ = self.entries.pop(key)
+        self.size -= len(value)
@@ -2,6 +2,14 @@ from typing import Optional, Union, NoReturn
 
 from db.cache import AbstractCache
 
+# Удаляем блокировку, только если её не перехватил другой воркер после истечения
+RELEASE_LOCK_SCRIPT: str = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
 
 class CacheRedis(AbstractCache):
     async def get(self, key: str) -> Optional[dict]:
@@ -10,5 +18,16 @@ class CacheRedis(AbstractCache):
     async def set(self, key: str, value: Union[bytes, str], expire: int):
         await self.cache.set(key=key, value=value, expire=expire)
 
+    async def acquire_lock(self, key: str, token: str, timeout: float) -> bool:
+        return await self.cache.set(
+            key,
+            token,
+            pexpire=int(timeout * 1000),
+            exist=self.cache.SET_IF_NOT_EXIST,
+        )
+
+    async def release_lock(self, key: str, token: str):
+        await self.cache.eval(RELEASE_LOCK_SCRIPT, keys=[key], args=[token])
+
     async def close(self) -> NoReturn:
         self.cache.close()
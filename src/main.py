@@ -6,7 +6,8 @@ from fastapi.responses import ORJSONResponse
 
 from api.v1 import film, genre, person
 from core import config
-from db import cache, elastic, redis, storage
+from db import cache, elastic, memory, redis, storage
+from services.cache_entry import read_soft_expiry
 
 app = FastAPI(
     title=config.PROJECT_NAME,  # Конфигурируем название проекта
@@ -26,13 +27,25 @@ async def root():
     return {"service": config.PROJECT_NAME, "version": config.VERSION}
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Попадания и промахи кеша этого воркера по уровням"""
+    return cache.cache.stats()
+
+
 @app.on_event("startup")
 async def startup():
     """Подключаемся к базам при старте сервера"""
-    cache.cache = redis.CacheRedis(
-        cache_instance=await aioredis.create_redis_pool(
-            (config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20
-        )
+    cache.cache = memory.CacheInMemory(
+        cache_instance=redis.CacheRedis(
+            cache_instance=await aioredis.create_redis_pool(
+                (config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20
+            )
+        ),
+        max_items=config.CACHE_MEMORY_MAX_ITEMS,
+        max_bytes=config.CACHE_MEMORY_MAX_BYTES,
+        ttl=config.CACHE_MEMORY_TTL,
+        soft_expiry=read_soft_expiry,
     )
     storage.storage = elastic.StorageElasticsearch(
         storage_instance=AsyncElasticsearch(
@@ -0,0 +1,50 @@
+import math
+import random
+import time
+from typing import NamedTuple, Union
+
+from core.config import CACHE_EARLY_REFRESH_BETA
+
+
+class CacheEntry(NamedTuple):
+    """
+    Значение в кеше вместе с мягким сроком (unix-время, после которого
+    его пора обновить) и временем, за которое оно было получено.
+    """
+
+    value: bytes
+    soft_expiry: float
+    delta: float
+
+    def should_refresh(self) -> bool:
+        """
+        Вероятностное раннее обновление (XFetch): чем ближе мягкий срок
+        и чем дольше значение считается, тем вероятнее обновить его заранее.
+        После мягкого срока — всегда.
+        """
+        early = -self.delta * CACHE_EARLY_REFRESH_BETA * math.log(1 - random.random())
+        return time.time() + early >= self.soft_expiry
+
+
+def pack_entry(value: Union[bytes, str], soft_expiry: float, delta: float) -> bytes:
+    """Заголовок «срок время» отделён от значения переводом строки"""
+    if isinstance(value, str):
+        value = value.encode()
+    return f"{soft_expiry:.3f} {delta:.4f}\n".encode() + value
+
+
+def unpack_entry(raw: Union[bytes, str]) -> CacheEntry:
+    if isinstance(raw, str):
+        raw = raw.encode()
+    header, _, value = raw.partition(b"\n")
+    try:
+        soft_expiry, delta = header.split()
+        return CacheEntry(value, float(soft_expiry), float(delta))
+    except ValueError:
+        # Запись без заголовка считаем устаревшей: отдаём и обновляем
+        return CacheEntry(raw, 0.0, 0.0)
+
+
+def read_soft_expiry(raw: Union[bytes, str]) -> float:
+    """Мягкий срок записи без разбора значения — для кеша в памяти"""
+    return unpack_entry(raw).soft_expiry
@@ -1,15 +1,20 @@
 from functools import lru_cache
 from typing import Optional
 
-import orjson
 from fastapi import Depends
 
 from db.cache import AbstractCache, get_cache
 from db.storage import AbstractStorage, get_storage
-from models.film import ESFilm, ListResponseFilm
+from models.film import DetailResponseFilm, ESFilm, FilmPagination, ListResponseFilm
+from models.person import FilmPerson
 from services.mixins import ServiceMixin
 from services.pagination import get_by_pagination
-from services.utils import create_hash_key, get_hits, get_params_films_to_elastic
+from services.utils import (
+    create_hash_key,
+    dump_response,
+    get_hits,
+    get_params_films_to_elastic,
+)
 
 
 class FilmService(ServiceMixin):
@@ -21,17 +26,19 @@ class FilmService(ServiceMixin):
         sorting: str = None,
         query: str = None,
         genre: str = None,
-    ) -> Optional[dict]:
-        """Производим полнотекстовый поиск по фильмам в Elasticsearch."""
+    ) -> Optional[bytes]:
+        """
+        Производим полнотекстовый поиск по фильмам в Elasticsearch.
+        В кеше хранится готовое тело ответа, при попадании модели не строятся.
+        """
         _source: tuple = ("id", "title", "imdb_rating", "genre")
-        # Получаем число фильмов из стейт
-        state_total: int = await self.get_total_count()
-        params: str = f"{state_total}{page}{sorting}{page_size}{query}{genre}"
-        # Пытаемся получить данные из кэша
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
+        # Права пользователя меняют выдачу, поэтому входят в ключ
+        params: list = [page, sorting, page_size, query, genre, sorted(permissions)]
+        key: str = create_hash_key(
+            index=self.index, params=params, generation=await self.get_generation()
         )
-        if not instance:
+
+        async def load() -> Optional[bytes]:
             # Если данных нет в кеше, то ищем его в Elasticsearch
             body: dict = get_params_films_to_elastic(
                 permissions=permissions, page_size=page_size, page=page, genre=genre, query=query
@@ -52,31 +59,54 @@ class FilmService(ServiceMixin):
                 )
                 for row in hits
             ]
-            # Сохраняем фильмы в кеш
-            data = orjson.dumps([i.dict() for i in films])
-            new_param: str = f"{total}{page}{sorting}{page_size}{query}{genre}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=self.index, params=new_param), instance=data
+            return dump_response(
+                FilmPagination(
+                    **get_by_pagination(
+                        name="films",
+                        db_objects=films,
+                        total=total,
+                        page=page,
+                        page_size=page_size,
+                    )
+                )
             )
-            # Сохраняем число фильмов в стейт
-            await self.set_total_count(value=total)
-            return get_by_pagination(
-                name="films",
-                db_objects=films,
-                total=total,
-                page=page,
-                page_size=page_size,
+
+        # Пытаемся получить данные из кэша
+        return await self._get_or_load(key=key, load=load)
+
+    async def get_film(self, film_id: str) -> Optional[bytes]:
+        """Готовое тело ответа с полной информацией о фильме"""
+        key: str = f"{self.index}:{await self.get_generation()}:response:{film_id}"
+
+        async def load() -> Optional[bytes]:
+            film = await self._get_data_from_elastic_by_id(target_id=film_id, schema=ESFilm)
+            if not film:
+                return None
+            actors_list: list[FilmPerson] = [
+                FilmPerson(uuid=actor.get("id"), full_name=actor.get("name"))
+                for actor in film.actors
+            ]
+            writers_list: list[FilmPerson] = [
+                FilmPerson(uuid=actor.get("id"), full_name=actor.get("name"))
+                for actor in film.writers
+            ]
+            directors_list: list[FilmPerson] = [
+                FilmPerson(uuid=director.get("id"), full_name=director.get("name"))
+                for director in film.directors
+            ]
+            return dump_response(
+                DetailResponseFilm(
+                    uuid=film.id,
+                    title=film.title,
+                    imdb_rating=film.imdb_rating,
+                    description=film.description,
+                    actors=actors_list,
+                    writers=writers_list,
+                    directors=directors_list,
+                )
             )
-        films_from_cache: list[ListResponseFilm] = [
-            ListResponseFilm(**row) for row in orjson.loads(instance)
-        ]
-        return get_by_pagination(
-            name="films",
-            db_objects=films_from_cache,
-            total=state_total,
-            page=page,
-            page_size=page_size,
-        )
+
+        return await self._get_or_load(key=key, load=load)
 
 
 # get_film_service — это провайдер FilmService. Синглтон
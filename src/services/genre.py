@@ -1,34 +1,32 @@
 from functools import lru_cache
 from typing import Optional
 
-import orjson
 from fastapi import Depends
 
 from db.cache import AbstractCache, get_cache
 from db.storage import AbstractStorage, get_storage
-from models.genre import ElasticGenre, FilmGenre
+from models.genre import DetailResponseGenre, ElasticGenre, FilmGenre, GenrePagination
 from services.mixins import ServiceMixin
 from services.pagination import get_by_pagination
-from services.utils import create_hash_key, get_hits
+from services.utils import create_hash_key, dump_response, get_hits
 
 
 class GenreService(ServiceMixin):
 
-    # get_genres_list возвращает список объектов жанра
-    async def get_genres_list(self, page: int, page_size: int) -> Optional[dict]:
+    # get_genres_list возвращает готовое тело ответа со списком жанров
+    async def get_genres_list(self, page: int, page_size: int) -> Optional[bytes]:
         body: dict = {
             "size": page_size,
             "from": (page - 1) * page_size,
             "query": {"match_all": {}},
         }
-        """ Получаем число фильмов из стейт """
-        state_total: int = await self.get_total_count()
-        params: str = f"{state_total}{page}{page_size}"
-        """ Пытаемся получить данные из кэша """
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
+        key: str = create_hash_key(
+            index=self.index,
+            params=[page, page_size],
+            generation=await self.get_generation(),
         )
-        if not instance:
+
+        async def load() -> Optional[bytes]:
             docs: Optional[dict] = await self.search_in_elastic(body=body)
             if not docs:
                 return None
@@ -40,29 +38,34 @@ class GenreService(ServiceMixin):
             genres: list[FilmGenre] = [
                 FilmGenre(uuid=es_genre.id, name=es_genre.name) for es_genre in hits
             ]
-            """ Сохраняем жанры в кеш """
-            data = orjson.dumps([i.dict() for i in genres])
-            new_param: str = f"{total}{page}{page_size}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=self.index, params=new_param), instance=data
+            return dump_response(
+                GenrePagination(
+                    **get_by_pagination(
+                        name="genres",
+                        db_objects=genres,
+                        total=total,
+                        page=page,
+                        page_size=page_size,
+                    )
+                )
             )
-            """ Сохраняем число жанров в стейт """
-            await self.set_total_count(value=total)
-            return get_by_pagination(
-                name="genres",
-                db_objects=genres,
-                total=total,
-                page=page,
-                page_size=page_size,
+
+        """ Пытаемся получить данные из кэша """
+        return await self._get_or_load(key=key, load=load)
+
+    # get_genre возвращает готовое тело ответа с жанром
+    async def get_genre(self, genre_id: str) -> Optional[bytes]:
+        key: str = f"{self.index}:{await self.get_generation()}:response:{genre_id}"
+
+        async def load() -> Optional[bytes]:
+            genre = await self._get_data_from_elastic_by_id(
+                target_id=genre_id, schema=ElasticGenre
             )
-        genres: list[FilmGenre] = [FilmGenre(**row) for row in orjson.loads(instance)]
-        return get_by_pagination(
-            name="genres",
-            db_objects=genres,
-            total=state_total,
-            page=page,
-            page_size=page_size,
-        )
+            if not genre:
+                return None
+            return dump_response(DetailResponseGenre(uuid=genre.id, name=genre.name))
+
+        return await self._get_or_load(key=key, load=load)
 
 
 # get_genre_service — это провайдер GenreService. Синглтон
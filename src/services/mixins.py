@@ -1,16 +1,34 @@
-from typing import Optional, Union
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, Union
+from uuid import uuid4
 
 from elasticsearch import NotFoundError
 
-from core.config import CACHE_EXPIRE_IN_SECONDS
-from db.cache import AbstractCache
+from core.config import (
+    CACHE_EXPIRE_IN_SECONDS,
+    CACHE_GENERATION_MEMO,
+    CACHE_LOCK_POLL,
+    CACHE_LOCK_TIMEOUT,
+    CACHE_STALE_IN_SECONDS,
+    CACHE_TTL_JITTER,
+)
+from db.cache import GENERATION_PREFIX, AbstractCache
 from db.storage import AbstractStorage
 from models.film import ESFilm
 from models.genre import ElasticGenre
 from models.person import ElasticPerson
+from services.cache_entry import CacheEntry, pack_entry, unpack_entry
+from services.single_flight import SingleFlight
 
 Schemas: tuple = (ESFilm, ElasticGenre, ElasticPerson)
 ES_schemas = Union[Schemas]
+# Загрузка значения для кеша: сериализованный объект или None, если его нет
+Loader = Callable[[], Awaitable[Optional[Union[bytes, str]]]]
+
+logger = logging.getLogger("cache")
 
 
 class ServiceMixin:
@@ -18,13 +36,28 @@ class ServiceMixin:
         self.cache: AbstractCache = cache
         self.storage: AbstractStorage = storage
         self.index: str = index
-        self.total_count: int = 0
-
-    async def get_total_count(self) -> int:
-        return self.total_count
+        # Поколения индексов, прочитанные из Redis, и время чтения
+        self.generations: dict[str, tuple[int, float]] = {}
+        self.flights = SingleFlight()
+        # Фоновые обновления устаревающих записей по ключу кеша
+        self.refreshes: dict[str, asyncio.Task] = {}
 
-    async def set_total_count(self, value: int):
-        self.total_count = value
+    async def get_generation(self, index: Optional[str] = None) -> int:
+        """
+        Поколение индекса, которое ETL увеличивает после каждой загруженной
+        пачки. Оно входит в ключи кеша, поэтому новая пачка сразу делает
+        прежние ответы недостижимыми во всех воркерах. Воркер помнит
+        прочитанное значение CACHE_GENERATION_MEMO секунд.
+        """
+        index = index or self.index
+        now = time.monotonic()
+        memo = self.generations.get(index)
+        if memo and now - memo[1] < CACHE_GENERATION_MEMO:
+            return memo[0]
+        value = await self.cache.get(key=f"{GENERATION_PREFIX}{index}")
+        generation = int(value) if value else 0
+        self.generations[index] = (generation, now)
+        return generation
 
     async def search_in_elastic(
         self, body: dict, _source=None, sort=None, _index=None
@@ -48,18 +81,17 @@ class ServiceMixin:
 
     async def get_by_id(self, target_id: str, schema: Schemas) -> Optional[ES_schemas]:
         """Пытаемся получить данные из кеша, потому что оно работает быстрее"""
-        instance = await self._get_result_from_cache(key=target_id)
-        if not instance:
+        key: str = f"{self.index}:{await self.get_generation()}:{target_id}"
+
+        async def load() -> Optional[str]:
             """Если данных нет в кеше, то ищем его в Elasticsearch"""
             instance = await self._get_data_from_elastic_by_id(
                 target_id=target_id, schema=schema
             )
-            if not instance:
-                return None
-            """ Сохраняем фильм в кеш """
-            await self._put_data_to_cache(key=instance.id, instance=instance.json())
-            return instance
-        return schema.parse_raw(instance)
+            return instance.json() if instance else None
+
+        instance = await self._get_or_load(key=key, load=load)
+        return schema.parse_raw(instance) if instance else None
 
     async def _get_data_from_elastic_by_id(
         self, target_id: str, schema: Schemas
@@ -71,10 +103,99 @@ class ServiceMixin:
         except NotFoundError:
             return None
 
-    async def _get_result_from_cache(self, key: str) -> Optional[bytes]:
+    async def _get_result_from_cache(self, key: str) -> Optional[CacheEntry]:
         """Пытаемся получить данные об объекте из кеша"""
-        return await self.cache.get(key=key) or None
+        raw = await self.cache.get(key=key)
+        return unpack_entry(raw) if raw else None
+
+    async def _put_data_to_cache(
+        self, key: str, instance: Union[bytes, str], delta: float = 0.0
+    ) -> None:
+        """
+        Сохраняем данные об объекте в кеш. Свежими они считаются
+        CACHE_EXPIRE_IN_SECONDS с разбросом CACHE_TTL_JITTER, чтобы записи,
+        созданные вместе, не устаревали одновременно, и ещё
+        CACHE_STALE_IN_SECONDS отдаются устаревшими на время обновления.
+        """
+        ttl: float = CACHE_EXPIRE_IN_SECONDS * (1 - CACHE_TTL_JITTER * random.random())
+        await self.cache.set(
+            key=key,
+            value=pack_entry(instance, soft_expiry=time.time() + ttl, delta=delta),
+            expire=int(ttl) + CACHE_STALE_IN_SECONDS,
+        )
+
+    async def _get_or_load(self, key: str, load: Loader) -> Optional[Union[bytes, str]]:
+        """
+        Значение из кеша, а при промахе — из load. Одновременные промахи
+        по одному ключу в воркере ждут одну загрузку, а между воркерами
+        загрузку выполняет тот, кто взял блокировку в Redis.
+        Устаревшее или близкое к сроку значение отдаётся сразу,
+        а обновляется в фоне.
+        """
+        entry = await self._get_result_from_cache(key=key)
+        if entry:
+            if entry.should_refresh():
+                self._refresh_in_background(key=key, load=load)
+            return entry.value
+        return await self.flights.do(key, lambda: self._fill_cache(key=key, load=load))
+
+    def _refresh_in_background(self, key: str, load: Loader) -> None:
+        if key in self.refreshes:
+            return
+        task = asyncio.create_task(self._refresh(key=key, load=load))
+        self.refreshes[key] = task
+        task.add_done_callback(lambda _: self.refreshes.pop(key, None))
 
-    async def _put_data_to_cache(self, key: str, instance: Union[bytes, str]) -> None:
-        """Сохраняем данные об объекте в кеш, время жизни кеша — 5 минут"""
-        await self.cache.set(key=key, value=instance, expire=CACHE_EXPIRE_IN_SECONDS)
+    async def _refresh(self, key: str, load: Loader) -> None:
+        """
+        Обновляет запись один воркер: если блокировку держит другой,
+        он уже загружает то же значение.
+        """
+        lock_key: str = f"lock:{key}"
+        token: str = uuid4().hex
+        try:
+            if CACHE_LOCK_TIMEOUT and not await self.cache.acquire_lock(
+                key=lock_key, token=token, timeout=CACHE_LOCK_TIMEOUT
+            ):
+                return
+            try:
+                await self._load_to_cache(key=key, load=load)
+            finally:
+                if CACHE_LOCK_TIMEOUT:
+                    await self.cache.release_lock(key=lock_key, token=token)
+        except Exception as e:
+            # Пока обновление не удалось, клиенты получают устаревшее значение
+            logger.warning(f"фоновое обновление {key} не удалось: {e!r}")
+
+    async def _fill_cache(self, key: str, load: Loader) -> Optional[Union[bytes, str]]:
+        if not CACHE_LOCK_TIMEOUT:
+            return await self._load_to_cache(key=key, load=load)
+        lock_key: str = f"lock:{key}"
+        token: str = uuid4().hex
+        deadline: float = time.monotonic() + CACHE_LOCK_TIMEOUT
+        while not await self.cache.acquire_lock(
+            key=lock_key, token=token, timeout=CACHE_LOCK_TIMEOUT
+        ):
+            # Загружает другой воркер: ждём его значение в кеше
+            await asyncio.sleep(CACHE_LOCK_POLL)
+            entry = await self._get_result_from_cache(key=key)
+            if entry:
+                return entry.value
+            if time.monotonic() >= deadline:
+                # Блокировка зависла дольше своего срока — не ждём дальше
+                return await self._load_to_cache(key=key, load=load)
+        try:
+            # Пока ждали блокировку, значение мог положить предыдущий владелец
+            entry = await self._get_result_from_cache(key=key)
+            return entry.value if entry else await self._load_to_cache(key=key, load=load)
+        finally:
+            await self.cache.release_lock(key=lock_key, token=token)
+
+    async def _load_to_cache(self, key: str, load: Loader) -> Optional[Union[bytes, str]]:
+        started: float = time.monotonic()
+        instance = await load()
+        if instance:
+            await self._put_data_to_cache(
+                key=key, instance=instance, delta=time.monotonic() - started
+            )
+        return instance
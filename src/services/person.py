@@ -2,29 +2,18 @@ from functools import lru_cache
 from http import HTTPStatus
 from typing import Optional
 
-import orjson
 from fastapi import Depends, HTTPException
 
 from db.cache import AbstractCache, get_cache
 from db.storage import AbstractStorage, get_storage
-from models.film import ESFilm, ListResponseFilm
-from models.person import DetailResponsePerson, ElasticPerson
+from models.film import ESFilm, FilmPagination, ListResponseFilm
+from models.person import DetailResponsePerson, ElasticPerson, PersonPagination
 from services.mixins import ServiceMixin
 from services.pagination import get_by_pagination
-from services.utils import create_hash_key, get_hits
+from services.utils import create_hash_key, dump_response, get_hits
 
 
 class PersonService(ServiceMixin):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.person_films: int = 0
-
-    async def get_person_films_count(self) -> int:
-        return self.person_films
-
-    async def set_person_films_count(self, value: int):
-        self.person_films = value
-
     async def get_person(self, person_id: str):
         person = await self.get_by_id(target_id=person_id, schema=ElasticPerson)
         if not person:
@@ -34,23 +23,48 @@ class PersonService(ServiceMixin):
             )
         return person
 
+    async def get_person_details(self, person_id: str) -> Optional[bytes]:
+        """Готовое тело ответа с именем, ролью и фильмографией персоны"""
+        key: str = f"{self.index}:{await self.get_generation()}:response:{person_id}"
+
+        async def load() -> Optional[bytes]:
+            person = await self.get_person(person_id=person_id)
+            return dump_response(
+                DetailResponsePerson(
+                    uuid=person.id,
+                    full_name=person.full_name,
+                    role=person.roles[0],
+                    film_ids=person.film_ids,
+                )
+            )
+
+        return await self._get_or_load(key=key, load=load)
+
     async def get_person_films(
-        self, film_ids: list[str], page: int, page_size: int, person_id: str
-    ) -> Optional[dict]:
-        """Получаем число фильмов персоны из стейт"""
-        state_total: int = await self.get_person_films_count()
-        body: dict = {
-            "size": page_size,
-            "from": (page - 1) * page_size,
-            "query": {"ids": {"values": film_ids}},
-        }
-        state_key: str = "person_films"
-        params: str = f"{state_total}{page}{page_size}{person_id}"
-        """ Пытаемся получить фильмы персоны из кэша """
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
+        self, page: int, page_size: int, person_id: str
+    ) -> Optional[bytes]:
+        """
+        Страница зависит от фильмографии персоны и от индекса фильмов,
+        поэтому в ключе оба поколения, а сама персона читается только при промахе.
+        """
+        params: list = [
+            "person_films",
+            page,
+            page_size,
+            person_id,
+            await self.get_generation(index="movies"),
+        ]
+        key: str = create_hash_key(
+            index=self.index, params=params, generation=await self.get_generation()
         )
-        if not instance:
+
+        async def load() -> Optional[bytes]:
+            person = await self.get_person(person_id=person_id)
+            body: dict = {
+                "size": page_size,
+                "from": (page - 1) * page_size,
+                "query": {"ids": {"values": person.film_ids}},
+            }
             docs: Optional[dict] = await self.search_in_elastic(
                 body=body, _index="movies"
             )
@@ -67,47 +81,36 @@ class PersonService(ServiceMixin):
                 )
                 for film in hits
             ]
-            data = orjson.dumps([i.dict() for i in person_films])
-            new_param: str = f"person_films{total}{page}{page_size}{person_id}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=state_key, params=new_param), instance=data
-            )
-            """ Сохраняем число персон в стейт """
-            await self.set_person_films_count(value=total)
-            return get_by_pagination(
-                name="films",
-                db_objects=person_films,
-                total=total,
-                page=page,
-                page_size=page_size,
+            return dump_response(
+                FilmPagination(
+                    **get_by_pagination(
+                        name="films",
+                        db_objects=person_films,
+                        total=total,
+                        page=page,
+                        page_size=page_size,
+                    )
+                )
             )
-        person_films: list[ListResponseFilm] = [
-            ListResponseFilm(**row) for row in orjson.loads(instance)
-        ]
-        return get_by_pagination(
-            name="films",
-            db_objects=person_films,
-            total=state_total,
-            page=page,
-            page_size=page_size,
-        )
+
+        """ Пытаемся получить фильмы персоны из кэша """
+        return await self._get_or_load(key=key, load=load)
 
     async def search_person(
         self, query: str, page: int, page_size: int
-    ) -> Optional[dict]:
+    ) -> Optional[bytes]:
         body: dict = {
             "size": page_size,
             "from": (page - 1) * page_size,
             "query": {"bool": {"must": [{"match": {"full_name": query}}]}},
         }
-        """ Получаем число персон из стейт """
-        state_total: int = await self.get_total_count()
-        params: str = f"{state_total}{page}{page_size}{query}"
-        """ Пытаемся получить данные из кэша """
-        instance = await self._get_result_from_cache(
-            key=create_hash_key(index=self.index, params=params)
+        key: str = create_hash_key(
+            index=self.index,
+            params=[page, page_size, query],
+            generation=await self.get_generation(),
         )
-        if not instance:
+
+        async def load() -> Optional[bytes]:
             docs: Optional[dict] = await self.search_in_elastic(body=body)
             if not docs:
                 return None
@@ -125,31 +128,20 @@ class PersonService(ServiceMixin):
                 )
                 for es_person in hits
             ]
-            """ Сохраняем персон в кеш """
-            data = orjson.dumps([i.dict() for i in persons])
-            new_param: str = f"{total}{page}{page_size}{query}"
-            await self._put_data_to_cache(
-                key=create_hash_key(index=self.index, params=new_param), instance=data
-            )
-            """ Сохраняем число персон в стейт """
-            await self.set_total_count(value=total)
-            return get_by_pagination(
-                name="persons",
-                db_objects=persons,
-                total=total,
-                page=page,
-                page_size=page_size,
+            return dump_response(
+                PersonPagination(
+                    **get_by_pagination(
+                        name="persons",
+                        db_objects=persons,
+                        total=total,
+                        page=page,
+                        page_size=page_size,
+                    )
+                )
             )
-        persons: list[DetailResponsePerson] = [
-            DetailResponsePerson(**row) for row in orjson.loads(instance)
-        ]
-        return get_by_pagination(
-            name="persons",
-            db_objects=persons,
-            total=state_total,
-            page=page,
-            page_size=page_size,
-        )
+
+        """ Пытаемся получить данные из кэша """
+        return await self._get_or_load(key=key, load=load)
 
 
 # get_person_service — это провайдер PersonService. Синглтон
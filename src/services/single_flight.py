@@ -0,0 +1,41 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых запросов внутри воркера: пока по ключу
+    выполняется загрузка, остальные вызовы с тем же ключом не запускают
+    свою, а ждут общий результат (или исключение) первой.
+    """
+
+    def __init__(self):
+        self.calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        while key in self.calls:
+            future = self.calls[key]
+            try:
+                # shield: отмена одного ожидающего не отменяет общий результат
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # Первый вызов отменили (клиент отключился) — загружаем сами
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если никто не ждал
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
@@ -1,6 +1,8 @@
 import hashlib
 from typing import Optional
-from pydantic import parse_obj_as
+
+import orjson
+from pydantic import BaseModel, parse_obj_as
 
 from services.mixins import Schemas
 
@@ -46,11 +48,21 @@ def get_hits(docs: Optional[dict], schema: Schemas):
     return parse_data
 
 
-def create_hash_key(index: str, params: str) -> str:
+def create_hash_key(index: str, params: list, generation: int = 0) -> str:
     """
     :param index: индекс в elasticsearch
-    :param params: параметры запроса
+    :param params: параметры запроса; сериализуются в JSON, чтобы соседние
+        значения не склеивались (page=1, page_size=15 и page=11, page_size=5)
+    :param generation: поколение индекса, которое увеличивает ETL
     :return: хешированый ключ в md5
     """
-    hash_key = hashlib.md5(params.encode()).hexdigest()
-    return f"{index}:{hash_key}"
+    hash_key = hashlib.md5(orjson.dumps(params)).hexdigest()
+    return f"{index}:{generation}:{hash_key}"
+
+
+def dump_response(model: BaseModel) -> bytes:
+    """
+    :param model: модель ответа
+    :return: готовое тело JSON-ответа, которое кешируется и отдаётся как есть
+    """
+    return orjson.dumps(model.dict())